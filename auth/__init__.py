@@ -1 +1,10 @@
-from .auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, register_user, get_current_user
+from .auth import (
+    authenticate_user,
+    create_access_token,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    register_user,
+    get_current_user,
+    invalidate_user,
+    user_cache
+)
+from .passwords import HashingOverloadedError, shutdown_password_executor
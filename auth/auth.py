@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
@@ -6,20 +7,31 @@ import jwt
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
-
-from db.supa.supadb import get_user, insert_user
+from cache import TTLCache
+from db.supa.supadb import get_user, insert_user, update_password_hash
 from schema import TokenData, User
 from schema.types import UserRegister
+from .passwords import pwd_context, hash_password, verify_and_update_password
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Authenticated users are cached briefly so requests skip the Supabase lookup
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Trust the JWT claims alone and never look the user up
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() == "true"
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def invalidate_user(username: str):
+    """Drop a cached user, call after anything about the user changes."""
+    user_cache.pop(username)
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -29,12 +41,17 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
+async def authenticate_user(username: str, password: str):
+    user = await asyncio.to_thread(get_user, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Stored with outdated bcrypt parameters, upgrade while we have the password
+        await asyncio.to_thread(update_password_hash, username, new_hash)
+        invalidate_user(username)
     return user
 
 
@@ -63,9 +80,18 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user(username=token_data.username)
-    if user is None:
+
+    if AUTH_STATELESS:
+        return User(username=token_data.username, email=payload.get("email"))
+
+    user = user_cache.get(token_data.username)
+    if user is not None:
+        return user
+    user_db = await asyncio.to_thread(get_user, username=token_data.username)
+    if user_db is None:
         raise credentials_exception
+    user = User(username=user_db.username, email=user_db.email)
+    user_cache.set(user.username, user)
     return user
 
 
@@ -77,13 +103,14 @@ async def get_current_active_user(
     return current_user
 
 
-def register_user(user: UserRegister):
-    user_db = get_user(username=user.username)
+async def register_user(user: UserRegister):
+    user_db = await asyncio.to_thread(get_user, username=user.username)
     if user_db:
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    hashed_password = get_password_hash(user.password)
-    result = insert_user(user=user, hashed_password=hashed_password)
+    hashed_password = await hash_password(user.password)
+    result = await asyncio.to_thread(insert_user, user=user, hashed_password=hashed_password)
+    invalidate_user(user.username)
     if not result:
         raise HTTPException(status_code=500, detail="Failed to register user")
 
@@ -0,0 +1,57 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# bcrypt cost; stored hashes with a lower cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads dedicated to hashing, bcrypt releases the GIL so they run in parallel
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hash operations allowed to run or wait at once, beyond that callers are turned away
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+
+
+class HashingOverloadedError(Exception):
+    pass
+
+
+async def _run(fn, *args):
+    # Only touched from the event loop thread, so a plain counter is enough
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HashingOverloadedError("Too many password operations in progress")
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password against its stored hash off the event loop.
+
+    Returns (valid, new_hash). new_hash is set when the stored hash uses
+    outdated parameters and should be replaced.
+    """
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
+
+
+def shutdown_password_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,10 @@
+from .factory import (
+    create_llm,
+    create_embeddings,
+    create_qdrant_client,
+    create_mongo_client,
+    create_user_store,
+    BACKEND
+)
+from .registry import registry, ClientRegistry, LazyClient
+
@@ -0,0 +1,35 @@
+import hashlib
+import math
+import re
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings from feature hashing: every word adds a signed
+    unit to one of `size` dimensions, and the result is L2-normalised.
+
+    Texts sharing words get similar vectors, which is enough to exercise
+    retrieval without a model or network.
+    """
+
+    def __init__(self, size: int = 384):
+        self.size = size
+        self.model_name = f"hash-{size}"
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        if not any(vector):
+            # Qdrant cannot normalise a zero vector for cosine distance
+            vector[0] = 1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
@@ -0,0 +1,64 @@
+import os
+
+# "live" talks to the hosted services, "fake" swaps every one of them for the
+# local stand-ins in this package. Each service can be overridden on its own.
+BACKEND = os.getenv("BACKEND", "live")
+LLM_BACKEND = os.getenv("LLM_BACKEND", BACKEND)
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", BACKEND)
+QDRANT_BACKEND = os.getenv("QDRANT_BACKEND", BACKEND)
+MONGO_BACKEND = os.getenv("MONGO_BACKEND", BACKEND)
+USER_BACKEND = os.getenv("USER_BACKEND", BACKEND)
+
+
+def _is_fake(backend: str) -> bool:
+    if backend not in ("live", "fake"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'live' or 'fake'")
+    return backend == "fake"
+
+
+def create_llm(**groq_kwargs):
+    """Groq chat model, or FakeChatModel."""
+    if _is_fake(LLM_BACKEND):
+        from .llm import FakeChatModel
+        return FakeChatModel()
+    from langchain_groq import ChatGroq
+    return ChatGroq(**groq_kwargs)
+
+
+def create_embeddings():
+    """Cloudflare Workers AI embeddings, or HashEmbeddings. Both expose `model_name`."""
+    if _is_fake(EMBEDDINGS_BACKEND):
+        from .embeddings import HashEmbeddings
+        return HashEmbeddings()
+    from langchain_cloudflare.embeddings import CloudflareWorkersAIEmbeddings
+    return CloudflareWorkersAIEmbeddings(
+        account_id=os.environ['ACCOUNT_ID'],
+        api_token=os.environ['API_TOKEN'],
+        model_name=os.environ['MODEL_NAME'],
+    )
+
+
+def create_qdrant_client():
+    """Qdrant server client, or Qdrant's local in-memory mode."""
+    from qdrant_client import QdrantClient
+    if _is_fake(QDRANT_BACKEND):
+        return QdrantClient(":memory:")
+    return QdrantClient(url=os.getenv("Q_URL"), api_key=os.getenv("Q_API_KEY"), prefer_grpc=True)
+
+
+def create_mongo_client(**pool_kwargs):
+    """pymongo AsyncMongoClient, or FakeAsyncMongoClient."""
+    if _is_fake(MONGO_BACKEND):
+        from .mongo import FakeAsyncMongoClient
+        return FakeAsyncMongoClient()
+    from pymongo import AsyncMongoClient
+    return AsyncMongoClient(os.getenv("CONNECTION_STRING"), **pool_kwargs)
+
+
+def create_user_store():
+    """Supabase client, or FakeSupabase."""
+    if _is_fake(USER_BACKEND):
+        from .users import FakeSupabase
+        return FakeSupabase()
+    from supabase import create_client
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.3"))
+FAKE_LLM_SECONDS_PER_TOKEN = float(os.getenv("FAKE_LLM_SECONDS_PER_TOKEN", "0.002"))
+FAKE_LLM_REPLY_WORDS = int(os.getenv("FAKE_LLM_REPLY_WORDS", "64"))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model stand-in with a Groq-like latency profile and no network.
+
+    Prompts with a system message get their last human message echoed back,
+    which is what the OCR cleanup chain expects. Any other prompt is answered
+    with its last `reply_words` words. Every reply costs `latency` seconds to
+    the first token plus `seconds_per_token` per word.
+    """
+
+    model_name: str = "fake-llm"
+    latency: float = FAKE_LLM_LATENCY
+    seconds_per_token: float = FAKE_LLM_SECONDS_PER_TOKEN
+    reply_words: int = FAKE_LLM_REPLY_WORDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        has_system = any(isinstance(message, SystemMessage) for message in messages)
+        humans = [message for message in messages if isinstance(message, HumanMessage)]
+        if has_system and humans:
+            return re.findall(r"\S+\s*", str(humans[-1].content))
+        words = re.findall(r"\S+\s*", " ".join(str(message.content) for message in messages))
+        return words[-self.reply_words:]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        words = self._reply(messages)
+        time.sleep(self.latency + self.seconds_per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(words).strip()))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        words = self._reply(messages)
+        await asyncio.sleep(self.latency + self.seconds_per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(words).strip()))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for word in self._reply(messages):
+            time.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for word in self._reply(messages):
+            await asyncio.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
@@ -0,0 +1,295 @@
+import asyncio
+import copy
+import os
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+# Added to every fake Mongo round trip, to mimic a network hop
+FAKE_MONGO_LATENCY = float(os.getenv("FAKE_MONGO_LATENCY", "0"))
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                ok = value is not _MISSING and value in operand
+            elif operator == "$nin":
+                ok = value is _MISSING or value not in operand
+            elif operator == "$ne":
+                ok = value != operand
+            elif operator == "$exists":
+                ok = (value is not _MISSING) == bool(operand)
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is _MISSING or value is None:
+                    return False
+                ok = {"$gt": value > operand, "$gte": value >= operand,
+                      "$lt": value < operand, "$lte": value <= operand}[operator]
+            else:
+                raise NotImplementedError(f"Fake Mongo does not support {operator}")
+            if not ok:
+                return False
+        return True
+    return (None if value is _MISSING else value) == condition
+
+
+def _matches(doc: dict, query: Optional[dict]) -> bool:
+    return all(_matches_condition(_get(doc, field), condition) for field, condition in (query or {}).items())
+
+
+def _evaluate(doc: dict, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict) and len(expression) == 1:
+        (operator, operand), = expression.items()
+        if operator == "$ifNull":
+            for option in operand:
+                value = _evaluate(doc, option)
+                if value is not None:
+                    return value
+            return None
+        if operator == "$size":
+            return len(_evaluate(doc, operand))
+    if isinstance(expression, list):
+        return [_evaluate(doc, item) for item in expression]
+    return expression
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if all(value == 0 for value in fields.values()):
+        result = {key: copy.deepcopy(value) for key, value in doc.items() if fields.get(key, 1)}
+    else:
+        result = {}
+        for key, value in fields.items():
+            if value == 1 or value is True:
+                found = _get(doc, key)
+                if found is not _MISSING:
+                    result[key] = copy.deepcopy(found)
+            elif value != 0:
+                result[key] = _evaluate(doc, value)
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort_key(field: str):
+    def key(doc):
+        value = _get(doc, field)
+        return (value is not _MISSING and value is not None, value if value is not _MISSING else None)
+    return key
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict] = None):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        keys = [(key, direction)] if isinstance(key, str) else list(key)
+        for field, field_direction in reversed(keys):
+            self._docs.sort(key=_sort_key(field), reverse=field_direction < 0)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self) -> List[dict]:
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        results = self._results()
+        return results[:length] if length else results
+
+    async def __aiter__(self):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        for doc in self._results():
+            yield doc
+
+
+class FakeCollection:
+    """In-process stand-in for an AsyncCollection, covering the calls db.mongo makes."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: List[dict] = []
+        self._unique: List[List[str]] = []
+
+    async def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        fields = [keys] if isinstance(keys, str) else [field for field, _ in keys]
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return "_".join(fields)
+
+    def _check_unique(self, doc: dict, ignore: Optional[dict] = None):
+        for fields in self._unique:
+            key = [_get(doc, field) for field in fields]
+            for other in self._docs:
+                if other is not ignore and [_get(other, field) for field in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} {fields}")
+
+    def _insert(self, doc: dict) -> Any:
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self._docs.append(doc)
+        return doc["_id"]
+
+    def _first(self, query: Optional[dict]) -> Optional[dict]:
+        return next((doc for doc in self._docs if _matches(doc, query)), None)
+
+    async def insert_one(self, doc: dict):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        inserted_id = self._insert(doc)
+        doc.setdefault("_id", inserted_id)
+        return SimpleNamespace(inserted_id=inserted_id, acknowledged=True)
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        return SimpleNamespace(inserted_ids=[self._insert(doc) for doc in docs], acknowledged=True)
+
+    def _update(self, query: dict, update: dict, upsert: bool) -> SimpleNamespace:
+        doc = self._first(query)
+        upserted_id = None
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            upserted_id = self._insert({key: value for key, value in query.items() if not isinstance(value, dict)})
+            doc = self._docs[-1]
+        for operator, fields in update.items():
+            if operator == "$set":
+                doc.update(copy.deepcopy(fields))
+            elif operator == "$unset":
+                for field in fields:
+                    doc.pop(field, None)
+            elif operator == "$inc":
+                for field, amount in fields.items():
+                    doc[field] = doc.get(field, 0) + amount
+            else:
+                raise NotImplementedError(f"Fake Mongo does not support {operator}")
+        if upserted_id is not None:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=upserted_id)
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        return self._update(query, update, upsert)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        doc = self._first(query)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(replacement))
+        replacement = {**copy.deepcopy(replacement), "_id": doc["_id"]}
+        self._check_unique(replacement, ignore=doc)
+        self._docs[self._docs.index(doc)] = replacement
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        for request in requests:
+            # pymongo.UpdateOne keeps its arguments in private attributes
+            self._update(request._filter, request._doc, bool(request._upsert))
+        return SimpleNamespace(acknowledged=True)
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor([doc for doc in self._docs if _matches(doc, query)], projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        doc = self._first(query)
+        return None if doc is None else _project(doc, projection)
+
+    async def delete_one(self, query: dict):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        doc = self._first(query)
+        if doc is not None:
+            self._docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query: dict):
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        kept = [doc for doc in self._docs if not _matches(doc, query)]
+        deleted = len(self._docs) - len(kept)
+        self._docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def count_documents(self, query: dict) -> int:
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        return sum(1 for doc in self._docs if _matches(doc, query))
+
+    async def aggregate(self, pipeline: List[dict], **kwargs) -> FakeCursor:
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        docs = self._docs
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if _matches(doc, spec)]
+            elif operator == "$sort":
+                docs = list(docs)
+                for field, direction in reversed(list(spec.items())):
+                    docs.sort(key=_sort_key(field), reverse=direction < 0)
+            elif operator == "$limit":
+                docs = docs[:spec]
+            elif operator == "$project":
+                docs = [_project(doc, spec) for doc in docs]
+            else:
+                raise NotImplementedError(f"Fake Mongo does not support {operator}")
+        return FakeCursor(list(docs))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+
+    async def command(self, name: str) -> dict:
+        await asyncio.sleep(FAKE_MONGO_LATENCY)
+        return {"ok": 1.0}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+
+class FakeAsyncMongoClient:
+    """Process-local, in-memory stand-in for pymongo's AsyncMongoClient."""
+
+    def __init__(self):
+        self._databases: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase()
+        return self._databases[name]
+
+    async def close(self):
+        pass
@@ -0,0 +1,170 @@
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single readiness check may take before its backend counts as down
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2"))
+
+
+async def _call(fn, *args):
+    """Await fn when it is async, run it in a thread otherwise."""
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args)
+    result = await asyncio.to_thread(fn, *args)
+    # A sync callable that returned a coroutine, e.g. a lambda around an async method
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class _Entry:
+    def __init__(self, factory: Callable[[], Any], close: Optional[Callable] = None,
+                 check: Optional[Callable] = None, setup: Optional[Callable] = None):
+        self.factory = factory
+        self.close = close
+        self.check = check
+        self.setup = setup
+        self.instance = None
+        self.created = False
+        self.lock = threading.Lock()
+
+
+class ClientRegistry:
+    """
+    Process-local registry of the clients of external services.
+
+    Nothing connects at import time: a client is created by its factory the
+    first time it is used, in the process that uses it. After a fork the
+    child drops the parent's clients and creates its own. The app lifespan
+    warms every client up in the background, runs its `setup` (indexes,
+    collection layout) and closes them all on shutdown.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.warmup_errors: Dict[str, str] = {}
+        self.warmup_seconds: Optional[float] = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def register(self, name: str, factory: Callable[[], Any], close: Optional[Callable] = None,
+                 check: Optional[Callable] = None, setup: Optional[Callable] = None):
+        """
+        `close(client)` releases the client on shutdown, `check(client)`
+        raises when the backend is unhealthy and `setup(client)` runs once
+        during warmup. Each may be sync or async.
+        """
+        self._entries[name] = _Entry(factory, close, check, setup)
+
+    def get(self, name: str):
+        entry = self._entries[name]
+        if not entry.created:
+            with entry.lock:
+                if not entry.created:
+                    entry.instance = entry.factory()
+                    entry.created = True
+        return entry.instance
+
+    def lazy(self, name: str, resolve: Optional[Callable[[Any], Any]] = None) -> "LazyClient":
+        return LazyClient(self, name, resolve)
+
+    def reset(self):
+        # Connections and locks inherited through fork must not be shared
+        for entry in self._entries.values():
+            entry.instance = None
+            entry.created = False
+            entry.lock = threading.Lock()
+        self._warmup_task = None
+
+    async def _warm(self, name: str):
+        entry = self._entries[name]
+        try:
+            client = await asyncio.to_thread(self.get, name)
+            if entry.setup:
+                await _call(entry.setup, client)
+            self.warmup_errors.pop(name, None)
+        except Exception as e:
+            self.warmup_errors[name] = str(e)
+            logger.warning("Warming up %s failed: %s", name, e)
+
+    async def warmup(self):
+        start = time.perf_counter()
+        await asyncio.gather(*(self._warm(name) for name in self._entries))
+        self.warmup_seconds = time.perf_counter() - start
+
+    def start(self):
+        """Warm every client up in the background; requests are served meanwhile."""
+        self._warmup_task = asyncio.create_task(self.warmup())
+
+    async def readiness(self, timeout: float = READY_CHECK_TIMEOUT) -> Dict[str, dict]:
+        """Run every backend's check concurrently, {name: {"ok": bool, "error"?: str}}."""
+
+        async def check(name: str, entry: _Entry):
+            try:
+                client = await asyncio.wait_for(asyncio.to_thread(self.get, name), timeout)
+                if entry.check:
+                    await asyncio.wait_for(_call(entry.check, client), timeout)
+                return name, {"ok": True}
+            except asyncio.TimeoutError:
+                return name, {"ok": False, "error": f"no answer within {timeout}s"}
+            except Exception as e:
+                return name, {"ok": False, "error": str(e)}
+
+        results = await asyncio.gather(*(check(name, entry) for name, entry in self._entries.items()))
+        return dict(results)
+
+    async def shutdown(self):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+        for name, entry in self._entries.items():
+            if entry.created and entry.close:
+                try:
+                    await _call(entry.close, entry.instance)
+                except Exception as e:
+                    logger.warning("Closing %s failed: %s", name, e)
+            entry.instance = None
+            entry.created = False
+
+
+class LazyClient:
+    """
+    Stand-in for a registry client that is resolved on every use, so module
+    level names can be bound at import without creating anything.
+    `resolve` derives an object from the client (a Mongo collection, say)
+    and is cached for as long as the client stays the same.
+    """
+
+    __slots__ = ("_registry", "_name", "_resolve", "_cached")
+
+    def __init__(self, registry: ClientRegistry, name: str, resolve: Optional[Callable[[Any], Any]] = None):
+        self._registry = registry
+        self._name = name
+        self._resolve = resolve
+        self._cached = (None, None)
+
+    def _target(self):
+        client = self._registry.get(self._name)
+        if self._resolve is None:
+            return client
+        source, resolved = self._cached
+        if source is not client:
+            resolved = self._resolve(client)
+            self._cached = (client, resolved)
+        return resolved
+
+    def __getattr__(self, attr: str):
+        return getattr(self._target(), attr)
+
+    def __getitem__(self, key):
+        return self._target()[key]
+
+
+registry = ClientRegistry()
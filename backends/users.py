@@ -0,0 +1,60 @@
+import copy
+import threading
+from types import SimpleNamespace
+from typing import Dict, List
+
+
+class _FakeQuery:
+    def __init__(self, table: "_FakeTable", action: str, values: dict = None):
+        self._table = table
+        self._action = action
+        self._values = values
+        self._filters = []
+        self._limit = None
+
+    def eq(self, column: str, value):
+        self._filters.append((column, value))
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        with self._table.lock:
+            if self._action == "insert":
+                self._table.rows.append(copy.deepcopy(self._values))
+                return SimpleNamespace(data=[copy.deepcopy(self._values)])
+            rows = [row for row in self._table.rows if all(row.get(column) == value for column, value in self._filters)]
+            if self._action == "update":
+                for row in rows:
+                    row.update(self._values)
+            rows = rows[:self._limit] if self._limit is not None else rows
+            return SimpleNamespace(data=copy.deepcopy(rows))
+
+
+class _FakeTable:
+    def __init__(self):
+        self.rows: List[dict] = []
+        self.lock = threading.Lock()
+
+    def select(self, columns: str = "*") -> _FakeQuery:
+        return _FakeQuery(self, "select")
+
+    def insert(self, values: dict) -> _FakeQuery:
+        return _FakeQuery(self, "insert", values)
+
+    def update(self, values: dict) -> _FakeQuery:
+        return _FakeQuery(self, "update", values)
+
+
+class FakeSupabase:
+    """In-memory stand-in for the Supabase client's table API used by db.supa."""
+
+    def __init__(self):
+        self._tables: Dict[str, _FakeTable] = {}
+
+    def table(self, name: str) -> _FakeTable:
+        if name not in self._tables:
+            self._tables[name] = _FakeTable()
+        return self._tables[name]
@@ -0,0 +1,142 @@
+"""
+Compare the blank-line paragraph splitter (one point per paragraph) with the
+token-aware chunker on a synthetic OCR-like corpus: running headers, page
+numbers, captions, regular paragraphs and a few table dumps.
+
+Reports chunk counts and sizes, the tokens sent to the embedding model (the
+ingest cost), indexing time and recall@k / MRR on an in-memory Qdrant
+collection. A query targets one paragraph and counts as found when a
+returned chunk covers that paragraph.
+
+Runs offline with the stand-in dense model from bench_retrieval.
+
+Usage:
+    python -m benchmarks.bench_chunking [--documents 20] [--queries 200] [--k 5] [--mode hybrid]
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, Filter, FieldCondition, MatchValue
+
+from benchmarks.bench_retrieval import StandInEmbeddings, TOPICS, FILLER
+from chunking import chunk_pages, count_tokens
+from db.qdrant import ensure_collection, search_points, BM25SparseEmbeddings, SPARSE_VECTOR_NAME
+from schema import DocumentModel
+
+# Input limit of the embedding model; longer chunks are truncated by it
+MODEL_MAX_TOKENS = 512
+
+
+def make_document(index: int, rng: random.Random) -> DocumentModel:
+    topic = TOPICS[rng.choice(list(TOPICS))].split()
+
+    def sentence():
+        return " ".join(rng.choice(topic if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(8, 20))) + "."
+
+    pages = []
+    for page_num in range(1, rng.randint(3, 8) + 1):
+        paragraphs = ["ACME LEGAL SERVICES CONFIDENTIAL", f"- {page_num} -"]
+        for _ in range(rng.randint(2, 8)):
+            roll = rng.random()
+            if roll < 0.2:
+                paragraphs.append(f"Figure {rng.randint(1, 40)}: {sentence()}")
+            elif roll < 0.25:
+                paragraphs.append(" ".join(str(rng.randint(0, 9999)) for _ in range(600)))
+            else:
+                paragraphs.append(" ".join(sentence() for _ in range(rng.randint(2, 8))))
+        pages.append({
+            "page": page_num,
+            "original_text": "",
+            "refined_text": "\n\n".join(paragraphs),
+            "paragraphs": [{"paragraph": i + 1, "refined_text": text} for i, text in enumerate(paragraphs)],
+        })
+    return DocumentModel(document_id=f"doc{index}", filename=f"doc{index}.pdf", username="bench", pages=pages)
+
+
+def paragraph_points(document: DocumentModel):
+    # The current splitter: every paragraph is its own point
+    return [(paragraph.refined_text, (page.page, paragraph.paragraph), (page.page, paragraph.paragraph))
+            for page in document.pages for paragraph in page.paragraphs]
+
+
+def chunk_points(document: DocumentModel):
+    return [(chunk.text, (chunk.page, chunk.paragraph), (chunk.page_end, chunk.paragraph_end))
+            for chunk in chunk_pages(document.pages)]
+
+
+def make_queries(documents, count: int, rng: random.Random):
+    candidates = [
+        (document.document_id, page.page, paragraph.paragraph, paragraph.refined_text)
+        for document in documents for page in document.pages for paragraph in page.paragraphs
+        if 40 <= count_tokens(paragraph.refined_text) <= MODEL_MAX_TOKENS
+    ]
+    queries = []
+    for document_id, page, paragraph, text in rng.sample(candidates, min(count, len(candidates))):
+        words = [word.strip(".") for word in text.split() if word.strip(".") not in FILLER]
+        queries.append((" ".join(rng.sample(words, min(6, len(words)))), document_id, (page, paragraph)))
+    return queries
+
+
+def run(name: str, splitter, documents, queries, dense, sparse, k: int, mode: str):
+    points = [(document.document_id, *point) for document in documents for point in splitter(document)]
+    sizes = [count_tokens(text) for _, text, _, _ in points]
+
+    client = QdrantClient(":memory:")
+    collection = f"bench_{name}"
+    ensure_collection(client, collection, len(dense.embed_query("probe")))
+
+    start = time.perf_counter()
+    texts = [text for _, text, _, _ in points]
+    dense_vectors = dense.embed_documents(texts)
+    sparse_vectors = sparse.embed_documents(texts)
+    client.upsert(collection, [
+        PointStruct(id=str(uuid.uuid4()), vector={"": dense_vector, SPARSE_VECTOR_NAME: sparse_vector.model_dump()},
+                    payload={"page_content": text, "metadata": {"group_id": "bench", "document_id": document_id,
+                                                                "start": list(start_at), "end": list(end_at)}})
+        for (document_id, text, start_at, end_at), dense_vector, sparse_vector
+        in zip(points, dense_vectors, sparse_vectors)
+    ])
+    index_time = time.perf_counter() - start
+
+    tenant_filter = Filter(must=[FieldCondition(key="metadata.group_id", match=MatchValue(value="bench"))])
+    hits, reciprocal_ranks = 0, 0.0
+    for query, document_id, target in queries:
+        results = search_points(client, collection, query, tenant_filter, dense, sparse, mode=mode, k=k)
+        for rank, point in enumerate(results, start=1):
+            metadata = point.payload["metadata"]
+            if metadata["document_id"] == document_id and tuple(metadata["start"]) <= target <= tuple(metadata["end"]):
+                hits += 1
+                reciprocal_ranks += 1 / rank
+                break
+
+    print(f"{name}: {len(points)} points, tokens min {min(sizes)} / median {statistics.median(sizes):.0f} / "
+          f"max {max(sizes)}, {sum(1 for size in sizes if size < 16)} under 16 tokens, "
+          f"{sum(1 for size in sizes if size > MODEL_MAX_TOKENS)} truncated by the model")
+    print(f"{' ' * len(name)}  embedded tokens {sum(min(size, MODEL_MAX_TOKENS) for size in sizes)}, "
+          f"indexing {index_time:.2f}s, recall@{k} {hits / len(queries):.3f}, MRR {reciprocal_ranks / len(queries):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default="hybrid")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(i, rng) for i in range(args.documents)]
+    queries = make_queries(documents, args.queries, rng)
+    dense, sparse = StandInEmbeddings(), BM25SparseEmbeddings()
+
+    run("paragraphs", paragraph_points, documents, queries, dense, sparse, args.k, args.mode)
+    run("chunker", chunk_points, documents, queries, dense, sparse, args.k, args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Offline end-to-end benchmark of /uploadfiles/, /query and /get_themes.
+
+The app runs in-process on the fake backends (BACKEND=fake): a fake LLM
+with configurable latency, hash embeddings, in-memory Qdrant, an in-process
+Mongo and user store. Synthetic PDFs are uploaded and every job is polled
+to time its stages (queued, processing = OCR + refinement + Mongo,
+indexing = embedding + Qdrant). Queries and theme extraction then run
+against the indexed documents. Finally the per-stage latency histograms of
+/metrics are summarised.
+
+Usage:
+    python -m benchmarks.bench_e2e [--documents 8] [--pages 6] [--queries 40] [--concurrency 8]
+        [--llm-latency 0.3] [--refine-all] [--ocr]
+
+--refine-all sends every page through the LLM cleanup pass and --ocr
+ignores the PDF text layer (needs the tesseract binary on PATH).
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import pymupdf
+
+WORDS = ("contract tenant court ruling invoice payment clause hearing evidence lease audit notice "
+         "deposit appeal budget delivery witness premises ledger transfer").split()
+
+
+def make_pdf(path: str, index: int, pages: int):
+    doc = pymupdf.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = [
+            f"Document {index} page {page_num + 1} line {i}: "
+            + " ".join(WORDS[(index * 13 + page_num * 7 + i * 3 + j) % len(WORDS)] for j in range(9))
+            for i in range(35)
+        ]
+        page.insert_text((50, 60), "\n".join(lines), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def percentiles(values) -> str:
+    values = sorted(values)
+    if not values:
+        return "n/a"
+
+    def at(q):
+        return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+    return f"p50 {at(0.5):.0f} ms, p95 {at(0.95):.0f} ms, p99 {at(0.99):.0f} ms"
+
+
+async def upload(client, headers, paths, pages: int):
+    files = [("files", (os.path.basename(path), open(path, "rb"), "application/pdf")) for path in paths]
+    start = time.perf_counter()
+    response = await client.post("/uploadfiles/", files=files, headers=headers)
+    response.raise_for_status()
+    jobs = response.json()["jobs"]
+
+    # First time each job was seen in each stage
+    seen = defaultdict(dict)
+    pending = {job["job_id"] for job in jobs}
+    failed = 0
+    while pending:
+        for job_id in list(pending):
+            job = (await client.get(f"/jobs/{job_id}", headers=headers)).json()
+            stage = job["stage"] if job["status"] == "processing" else job["status"]
+            seen[job_id].setdefault(stage or job["status"], time.perf_counter())
+            if job["status"] in ("done", "failed"):
+                if job["status"] == "failed":
+                    failed += 1
+                    print(f"job {job['filename']} failed: {job['error']}")
+                pending.discard(job_id)
+        await asyncio.sleep(0.02)
+    elapsed = time.perf_counter() - start
+
+    stage_times = defaultdict(list)
+    for stages in seen.values():
+        marks = [("queued", start)] + sorted(stages.items(), key=lambda item: item[1])
+        for (stage, at), (_, next_at) in zip(marks, marks[1:]):
+            stage_times[stage].append(next_at - at)
+
+    print(f"upload: {len(paths)} documents, {len(paths) * pages} pages in {elapsed:.2f}s "
+          f"-> {len(paths) * pages / elapsed:.1f} pages/s, {failed} failed")
+    for stage in ("queued", "processing", "indexing"):
+        print(f"  {stage:>10}: {percentiles(stage_times[stage])}")
+    documents = (await client.get("/vectorstore/get_documents", params={"limit": 500}, headers=headers)).json()
+    return [document["document_id"] for document in documents["documents"]]
+
+
+async def run_queries(client, headers, count: int, concurrency: int, stream: bool):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    context_tokens = []
+
+    async def one(i: int):
+        # Distinct queries, also across both passes, so the query cache does not answer them
+        body = {"query": f"what does the {WORDS[i % len(WORDS)]} clause say about {WORDS[(i * 7) % len(WORDS)]} "
+                         f"{i}{' streamed' if stream else ''}"}
+        async with semaphore:
+            start = time.perf_counter()
+            if stream:
+                # httpx's ASGI transport buffers the whole response, so only the total time is measured
+                async with client.stream("POST", "/query/stream", json=body, headers=headers) as response:
+                    await response.aread()
+            else:
+                response = await client.post("/query", json=body, headers=headers)
+                response.raise_for_status()
+                context_tokens.append(response.json()["context_tokens"])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    name = "/query/stream" if stream else "/query"
+    print(f"{name}: {count / elapsed:.1f} queries/s at concurrency {concurrency}, {percentiles(latencies)}")
+    if context_tokens:
+        print(f"  context: {sum(context_tokens) / len(context_tokens):.0f} tokens per query on average")
+
+
+async def run_themes(client, headers, document_ids):
+    for attempt in ("cold", "cached"):
+        start = time.perf_counter()
+        response = await client.post("/get_themes", json={"document_ids": document_ids}, headers=headers)
+        response.raise_for_status()
+        print(f"/get_themes ({attempt}, {len(document_ids)} documents): {time.perf_counter() - start:.2f}s")
+
+
+async def print_stage_metrics(client):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    text = (await client.get("/metrics")).text
+    totals = defaultdict(dict)
+    for family in text_string_to_metric_families(text):
+        if family.name == "rag_stage_seconds":
+            for sample in family.samples:
+                if sample.name.endswith(("_sum", "_count")):
+                    totals[sample.labels["stage"]][sample.name.rsplit("_", 1)[1]] = sample.value
+    print("stages (from /metrics):")
+    for stage, values in totals.items():
+        if values.get("count"):
+            print(f"  {stage:>14}: {int(values['count'])} calls, mean {values['sum'] / values['count'] * 1000:.1f} ms")
+
+
+async def run(args):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await client.post("/register/", data={"username": "bench", "password": "bench-password"})
+            token = (await client.post("/login", data={"username": "bench", "password": "bench-password"})).json()
+            headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+            workdir = tempfile.mkdtemp()
+            paths = []
+            for index in range(args.documents):
+                paths.append(os.path.join(workdir, f"bench-{index}.pdf"))
+                make_pdf(paths[-1], index, args.pages)
+
+            document_ids = await upload(client, headers, paths, args.pages)
+            await run_queries(client, headers, args.queries, args.concurrency, stream=False)
+            await run_queries(client, headers, args.queries, args.concurrency, stream=True)
+            await run_themes(client, headers, document_ids[:4])
+            print(f"stats: {(await client.get('/stats')).json()}")
+            await print_stage_metrics(client)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--refine-all", action="store_true")
+    parser.add_argument("--ocr", action="store_true")
+    args = parser.parse_args()
+
+    # Everything is configured from the environment at import time
+    os.environ["BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    # httpx logs every request at INFO
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite3")
+    if args.refine_all:
+        os.environ["REFINE_CONFIDENCE_THRESHOLD"] = "1.1"
+    if args.ocr:
+        os.environ["PDF_TEXT_LAYER"] = "0"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
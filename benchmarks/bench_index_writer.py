@@ -0,0 +1,85 @@
+"""
+Indexing throughput of the old single add_documents call against the
+batched, pipelined writer (db.qdrant.write_points).
+
+The embedding model returns a cheap pseudo-random vector per text after a
+fixed per-request latency, to stand in for the remote embedding API.
+Pass --url to write to a real Qdrant server instead of an in-memory one.
+
+Usage:
+    python -m benchmarks.bench_index_writer [--chunks 2000] [--latency 0.15] [--url http://localhost:6333]
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+
+from db.qdrant import ensure_collection, write_points, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+
+
+class SlowEmbeddings(Embeddings):
+    """Pseudo-random vectors behind a fixed latency per request, like a remote API."""
+
+    def __init__(self, latency: float, size: int = 384):
+        self.latency = latency
+        self.size = size
+        self.requests = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [[random.Random(text).random() - 0.5 for _ in range(self.size)] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def make_documents(count: int) -> List[Document]:
+    return [
+        Document(page_content=f"chunk {i} " + " ".join(f"word{(i * 7 + j) % 500}" for j in range(60)),
+                 metadata={"group_id": "bench", "document_id": "doc", "chunk_id": f"doc-{i}"})
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(":memory:")
+    documents = make_documents(args.chunks)
+    dense = SlowEmbeddings(args.latency)
+
+    name = f"bench_writer_{uuid.uuid4().hex[:8]}"
+    ensure_collection(client, name)
+    start = time.perf_counter()
+    # What insert_into_vectorstore did before: one add_documents call
+    QdrantVectorStore(client=client, collection_name=name, embedding=dense).add_documents(documents)
+    elapsed = time.perf_counter() - start
+    print(f"add_documents: {args.chunks / elapsed:.1f} chunks/s ({elapsed:.2f}s, {dense.requests} embedding requests)")
+    client.delete_collection(name)
+
+    dense.requests = 0
+    name = f"bench_writer_{uuid.uuid4().hex[:8]}"
+    ensure_collection(client, name)
+    report = asyncio.run(write_points(client, name, documents, dense, batch_size=args.batch_size,
+                                      embed_concurrency=args.concurrency))
+    print(f"write_points (batch {args.batch_size}, concurrency {args.concurrency}): "
+          f"{report['chunks_per_second']:.1f} chunks/s ({report['seconds']:.2f}s, {dense.requests} embedding requests)")
+    client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Login storm benchmark: logins/sec and the latency of an unrelated endpoint
+while many logins run at once.
+
+Compares the old inline bcrypt verification on the event loop with the
+bounded hashing executor. The Supabase user lookup is replaced by an
+in-memory user so only password hashing is measured.
+
+Usage:
+    python -m benchmarks.bench_login [--logins 200] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+for name, value in {"SUPABASE_URL": "https://bench.supabase.co", "SUPABASE_KEY": "bench.bench.bench",
+                    "SECRET_KEY": "bench", "ALGORITHM": "HS256"}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from auth import auth, passwords
+from schema import UserInDB
+
+USER = UserInDB(username="bench", hashed_password=passwords.pwd_context.hash("secret"))
+
+
+def make_app(inline: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(username: str, password: str):
+        if inline:
+            # What /login did before: bcrypt on the event loop thread
+            user = auth.get_user(username)
+            ok = user and passwords.pwd_context.verify(password, user.hashed_password)
+        else:
+            try:
+                ok = await auth.authenticate_user(username, password)
+            except passwords.HashingOverloadedError:
+                raise HTTPException(status_code=503)
+        if not ok:
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {}
+
+    return app
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def run(name: str, app: FastAPI, logins: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        statuses = []
+        ping_latencies = []
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/login", params={"username": "bench", "password": "secret"})
+                statuses.append(response.status_code)
+
+        async def pinger():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        ping_task = asyncio.create_task(pinger())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ping_task
+
+    ok = statuses.count(200)
+    print(f"{name}: {ok / elapsed:.1f} logins/s ({ok} ok, {statuses.count(503)} shed), "
+          f"/ping p50 {percentile(ping_latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(ping_latencies, 0.99) * 1000:.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    auth.get_user = lambda username: USER if username == USER.username else None
+    await run("inline bcrypt", make_app(inline=True), args.logins, args.concurrency)
+    await run("hashing executor", make_app(inline=False), args.logins, args.concurrency)
+    passwords.shutdown_password_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Measure event-loop latency while Mongo traffic runs, with the blocking
+pymongo client the app used before and with the async client it uses now.
+
+A probe task sleeps 1 ms in a loop and records how late it wakes up. Lag
+is what every other request on the same worker would wait.
+
+Usage:
+    CONNECTION_STRING=mongodb://... python -m benchmarks.bench_mongo_loop [--tasks 50] [--ops 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+from pymongo import AsyncMongoClient, MongoClient
+
+PROBE_INTERVAL = 0.001
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(loop.time() - start - PROBE_INTERVAL)
+
+
+def make_doc(run_id: str, i: int) -> dict:
+    return {"username": run_id, "document_id": str(uuid.uuid4()), "filename": f"{i}.pdf",
+            "pages": [{"page": 1, "refined_text": "x" * 2000}]}
+
+
+async def sync_worker(collection, run_id: str, ops: int):
+    # What the routes did before: blocking calls inside coroutines
+    for i in range(ops):
+        if i % 2:
+            collection.insert_one(make_doc(run_id, i))
+        else:
+            list(collection.find({"username": run_id}, {"_id": 0}).limit(20))
+
+
+async def async_worker(collection, run_id: str, ops: int):
+    for i in range(ops):
+        if i % 2:
+            await collection.insert_one(make_doc(run_id, i))
+        else:
+            await collection.find({"username": run_id}, {"_id": 0}).limit(20).to_list()
+
+
+async def run(name: str, worker, collection, tasks: int, ops: int):
+    run_id = f"bench-{uuid.uuid4()}"
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(collection, run_id, ops) for _ in range(tasks)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(f"{name}: {tasks * ops / elapsed:.0f} ops/s, loop lag "
+          f"mean {statistics.fmean(lags) * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, max {lags[-1] * 1000:.2f} ms")
+    return run_id
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=20)
+    args = parser.parse_args()
+
+    uri = os.environ["CONNECTION_STRING"]
+    sync_collection = MongoClient(uri)["user_text"]["bench_loop"]
+    async_client = AsyncMongoClient(uri)
+    async_collection = async_client["user_text"]["bench_loop"]
+
+    run_ids = [
+        await run("sync pymongo", sync_worker, sync_collection, args.tasks, args.ops),
+        await run("async pymongo", async_worker, async_collection, args.tasks, args.ops),
+    ]
+    await async_collection.delete_many({"username": {"$in": run_ids}})
+    await async_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Compare the serial OCR loop with the process-pool OCR engine.
+
+Usage:
+    python -m benchmarks.bench_ocr [--pages 32] [--workers N] [--pdf path]
+
+Without --pdf a synthetic text-heavy PDF is generated. Requires the
+tesseract binary on PATH.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import pymupdf
+import pytesseract
+
+from ocr import engine
+
+
+def make_pdf(path: str, pages: int):
+    doc = pymupdf.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = [f"Page {page_num + 1} line {i}: the quick brown fox jumps over the lazy dog." for i in range(40)]
+        page.insert_text((50, 60), "\n".join(lines), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def run_serial(path: str) -> int:
+    # The loop do_processing used before the process pool
+    doc = pymupdf.open(path)
+    count = 0
+    for page in doc:
+        pix = page.get_pixmap()
+        pytesseract.image_to_string(pix.pil_image())
+        count += 1
+    doc.close()
+    return count
+
+
+async def run_pool(path: str, use_text_layer: bool = False) -> int:
+    page_count = engine.pdf_page_count(path)
+    count = 0
+    async for _ in engine.iter_pdf_pages(path, page_count, use_text_layer=use_text_layer):
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=engine.OCR_WORKERS)
+    parser.add_argument("--pdf")
+    args = parser.parse_args()
+
+    engine.OCR_WORKERS = args.workers
+    path = args.pdf
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+        make_pdf(path, args.pages)
+
+    start = time.perf_counter()
+    pages = run_serial(path)
+    serial = time.perf_counter() - start
+    print(f"serial: {pages} pages in {serial:.2f}s -> {pages / serial:.2f} pages/s")
+
+    # Warm the pool so process start-up is not counted
+    list(engine.get_ocr_pool().map(engine.pdf_page_count, [path] * args.workers))
+    start = time.perf_counter()
+    pages = asyncio.run(run_pool(path))
+    pooled = time.perf_counter() - start
+    print(f"pool ({args.workers} workers): {pages} pages in {pooled:.2f}s -> {pages / pooled:.2f} pages/s")
+    print(f"speedup: {serial / pooled:.2f}x")
+
+    start = time.perf_counter()
+    pages = asyncio.run(run_pool(path, use_text_layer=True))
+    layered = time.perf_counter() - start
+    print(f"pool + text layer: {pages} pages in {layered:.2f}s -> {pages / layered:.2f} pages/s")
+
+    engine.shutdown_ocr_pool()
+
+
+if __name__ == "__main__":
+    main()
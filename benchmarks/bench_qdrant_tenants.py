@@ -0,0 +1,112 @@
+"""
+Filtered search latency against the number of tenants, with the collection
+layout the app used before (global HNSW, no payload indexes) and with the
+tenant-optimized one from db.qdrant.ensure_collection.
+
+Every tenant gets the same number of random points, so the collection grows
+with the tenant count while each search only ever matches one tenant.
+Qdrant builds HNSW graphs (per tenant with payload_m) in the background, so
+searches only start once the collection reports green, i.e. the optimizer
+is done; the time spent waiting is reported as "indexing".
+
+Usage:
+    Q_URL=http://localhost:6333 python -m benchmarks.bench_qdrant_tenants [--tenants 10 100 1000]
+        [--points-per-tenant 100] [--queries 200] [--index-timeout 600]
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, \
+    CollectionStatus
+
+from db.qdrant import ensure_collection
+
+VECTOR_SIZE = 384
+UPSERT_BATCH = 512
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def random_vector():
+    return [random.gauss(0, 1) for _ in range(VECTOR_SIZE)]
+
+
+def fill(client: QdrantClient, name: str, tenants: int, points_per_tenant: int):
+    batch = []
+    for tenant in range(tenants):
+        for _ in range(points_per_tenant):
+            batch.append(PointStruct(id=str(uuid.uuid4()), vector=random_vector(), payload={
+                "metadata": {"group_id": f"tenant-{tenant}", "document_id": str(uuid.uuid4())}
+            }))
+            if len(batch) >= UPSERT_BATCH:
+                client.upsert(name, batch, wait=True)
+                batch = []
+    if batch:
+        client.upsert(name, batch, wait=True)
+
+
+def wait_until_indexed(client: QdrantClient, name: str, timeout: float) -> float:
+    """Block until the optimizer has built the collection's indexes, return the seconds waited."""
+    start = time.perf_counter()
+    while client.get_collection(name).status != CollectionStatus.GREEN:
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"{name} was not indexed within {timeout}s")
+        time.sleep(0.5)
+    return time.perf_counter() - start
+
+
+def search(client: QdrantClient, name: str, tenants: int, queries: int):
+    latencies = []
+    for _ in range(queries):
+        tenant_filter = Filter(must=[FieldCondition(key="metadata.group_id",
+                                                    match=MatchValue(value=f"tenant-{random.randrange(tenants)}"))])
+        start = time.perf_counter()
+        client.query_points(name, query=random_vector(), query_filter=tenant_filter, limit=5)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(client: QdrantClient, layout: str, tenants: int, points_per_tenant: int, queries: int,
+        index_timeout: float):
+    name = f"bench_tenants_{uuid.uuid4().hex[:8]}"
+    if layout == "tenant":
+        ensure_collection(client, name, VECTOR_SIZE)
+    else:
+        # What the app created before: default HNSW and no payload indexes
+        client.create_collection(name, vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE))
+    try:
+        fill(client, name, tenants, points_per_tenant)
+        indexing = wait_until_indexed(client, name, index_timeout)
+        latencies = search(client, name, tenants, queries)
+    finally:
+        client.delete_collection(name)
+
+    print(f"{layout:>7} layout, {tenants:>5} tenants ({tenants * points_per_tenant} points): "
+          f"p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms, "
+          f"indexing {indexing:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.getenv("Q_URL"))
+    parser.add_argument("--tenants", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--points-per-tenant", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=os.getenv("Q_API_KEY"))
+    for tenants in args.tenants:
+        for layout in ("global", "tenant"):
+            run(client, layout, tenants, args.points_per_tenant, args.queries, args.index_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Offline relevance and latency of dense, sparse (BM25) and hybrid retrieval.
+
+A synthetic OCR-like corpus is indexed into an in-memory Qdrant collection
+created by db.qdrant.ensure_collection. Every query targets one known
+paragraph: half by a case number or rare surname found only there, half by
+a handful of its words. Reports recall@k, MRR and search latency per mode.
+
+The default dense model is a stand-in (averaged pseudo-random word vectors)
+so the benchmark needs no network. Pass --cloudflare to use the real
+embedding model configured by ACCOUNT_ID / API_TOKEN / MODEL_NAME.
+
+Usage:
+    python -m benchmarks.bench_retrieval [--paragraphs 2000] [--queries 200] [--k 5] [--cloudflare]
+"""
+import argparse
+import hashlib
+import math
+import os
+import random
+import re
+import time
+import uuid
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, Filter, FieldCondition, MatchValue
+
+from db.qdrant import ensure_collection, search_points, BM25SparseEmbeddings, SPARSE_VECTOR_NAME, RETRIEVAL_MODES
+
+TOPICS = {
+    "contracts": "agreement party breach clause obligation payment term termination notice supplier delivery",
+    "court": "court hearing judge appeal ruling motion evidence witness counsel verdict",
+    "medical": "patient diagnosis treatment dosage clinic symptoms referral therapy chart physician",
+    "finance": "invoice balance account interest loan statement audit ledger transfer budget",
+    "property": "tenant lease landlord premises rent deposit repair inspection eviction property",
+}
+FILLER = "the of and to in for with on by at from was were is are this that which under after before".split()
+SURNAMES = ["Abernathy", "Quennell", "Zhivago", "Okonkwo", "Vantongeren", "Hrabal", "Ishiguro", "Pellegrino",
+            "Szymborska", "Adeyemi", "Lindqvist", "Marchetti", "Nakashima", "Oyelaran", "Thorvaldsen"]
+
+
+class StandInEmbeddings(Embeddings):
+    """Average of pseudo-random unit vectors per word, a cheap offline dense model."""
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _word(self, word: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(word.encode()).digest())
+        return [rng.gauss(0, 1) for _ in range(self.size)]
+
+    def embed_query(self, text: str) -> List[float]:
+        total = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            total = [a + b for a, b in zip(total, self._word(word))]
+        norm = math.sqrt(sum(v * v for v in total)) or 1.0
+        return [v / norm for v in total]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def make_corpus(paragraphs: int, rng: random.Random):
+    corpus = []
+    for i in range(paragraphs):
+        topic = rng.choice(list(TOPICS))
+        words = [rng.choice(TOPICS[topic].split() if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(30, 90))]
+        case_number = f"{rng.randint(2015, 2024)}-CV-{i:05d}"
+        surname = f"{rng.choice(SURNAMES)}{i}"
+        words.insert(rng.randrange(len(words)), case_number)
+        words.insert(rng.randrange(len(words)), surname)
+        corpus.append({"text": " ".join(words), "case_number": case_number, "surname": surname})
+    return corpus
+
+
+def make_queries(corpus, count: int, rng: random.Random):
+    queries = []
+    for target in rng.sample(range(len(corpus)), count):
+        paragraph = corpus[target]
+        kind = rng.choice(["case", "surname", "words"])
+        if kind == "case":
+            query = f"what was decided in case {paragraph['case_number']}"
+        elif kind == "surname":
+            query = f"statement by {paragraph['surname']}"
+        else:
+            words = [w for w in paragraph["text"].split() if w not in FILLER]
+            query = " ".join(rng.sample(words, min(6, len(words))))
+        queries.append((query, target))
+    return queries
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--cloudflare", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.cloudflare:
+        from langchain_cloudflare.embeddings import CloudflareWorkersAIEmbeddings
+        dense = CloudflareWorkersAIEmbeddings(account_id=os.environ["ACCOUNT_ID"], api_token=os.environ["API_TOKEN"],
+                                              model_name=os.environ["MODEL_NAME"])
+    else:
+        dense = StandInEmbeddings()
+    sparse = BM25SparseEmbeddings()
+
+    corpus = make_corpus(args.paragraphs, rng)
+    queries = make_queries(corpus, args.queries, rng)
+
+    client = QdrantClient(":memory:")
+    name = "bench_retrieval"
+    vector_size = len(dense.embed_query("probe"))
+    ensure_collection(client, name, vector_size)
+
+    start = time.perf_counter()
+    texts = [paragraph["text"] for paragraph in corpus]
+    dense_vectors = dense.embed_documents(texts)
+    sparse_vectors = sparse.embed_documents(texts)
+    print(f"indexed {len(corpus)} paragraphs in {time.perf_counter() - start:.2f}s "
+          f"(BM25 encoding only: {timed(sparse.embed_documents, texts):.3f}s)")
+    client.upsert(name, [
+        PointStruct(id=str(uuid.uuid4()), vector={"": dense_vector, SPARSE_VECTOR_NAME: sparse_vector.model_dump()},
+                    payload={"page_content": text, "metadata": {"group_id": "bench", "paragraph": i}})
+        for i, (text, dense_vector, sparse_vector) in enumerate(zip(texts, dense_vectors, sparse_vectors))
+    ])
+
+    tenant_filter = Filter(must=[FieldCondition(key="metadata.group_id", match=MatchValue(value="bench"))])
+    for mode in RETRIEVAL_MODES:
+        hits, reciprocal_ranks, latencies = 0, 0.0, []
+        for query, target in queries:
+            start = time.perf_counter()
+            points = search_points(client, name, query, tenant_filter, dense, sparse, mode=mode, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            ranked = [point.payload["metadata"]["paragraph"] for point in points]
+            if target in ranked:
+                hits += 1
+                reciprocal_ranks += 1 / (ranked.index(target) + 1)
+        print(f"{mode:>6}: recall@{args.k} {hits / len(queries):.3f}, MRR {reciprocal_ranks / len(queries):.3f}, "
+              f"p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+
+def timed(fn, *fn_args) -> float:
+    start = time.perf_counter()
+    fn(*fn_args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
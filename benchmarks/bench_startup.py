@@ -0,0 +1,101 @@
+"""
+Startup benchmark: how fast a fresh process can serve, and when it is ready.
+
+Each scenario runs in a new interpreter (as a new worker would) and reports:
+  import   - `import main`, i.e. what a worker pays before it can fork/serve
+  lifespan - entering the app lifespan until requests are accepted
+  ready    - lifespan entry until GET /ready first answers 200
+  request  - GET / right after startup, while the warmup may still be running
+
+The "unreachable-qdrant" scenario points Qdrant at a closed port: the app
+must still start, and /ready must report Qdrant as down with a 503.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 3] [--ready-timeout 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    "fake": {"BACKEND": "fake"},
+    "unreachable-qdrant": {"BACKEND": "fake", "QDRANT_BACKEND": "live", "Q_URL": "http://127.0.0.1:9",
+                           "READY_CHECK_TIMEOUT": "1"},
+}
+
+
+async def measure(ready_timeout: float) -> dict:
+    import httpx
+
+    start = time.perf_counter()
+    import main
+    result = {"import": time.perf_counter() - start}
+
+    transport = httpx.ASGITransport(app=main.app)
+    start = time.perf_counter()
+    async with main.lifespan(main.app):
+        result["lifespan"] = time.perf_counter() - start
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            request_start = time.perf_counter()
+            (await client.get("/")).raise_for_status()
+            result["request"] = time.perf_counter() - request_start
+
+            result["ready"] = None
+            while time.perf_counter() - start < ready_timeout:
+                response = await client.get("/ready")
+                if response.status_code == 200:
+                    result["ready"] = time.perf_counter() - start
+                    break
+                await asyncio.sleep(0.05)
+            result["status"] = response.status_code
+            result["down"] = {name: backend["error"] for name, backend in response.json()["backends"].items()
+                              if not backend["ok"]}
+    return result
+
+
+def run_child(scenario: str, ready_timeout: float) -> dict:
+    env = {**os.environ, **SCENARIOS[scenario]}
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("ALGORITHM", "HS256")
+    env["EMBEDDING_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite3")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--ready-timeout", str(ready_timeout)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    # The app prints while it starts; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def fmt(seconds) -> str:
+    return "never" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ready-timeout", type=float, default=20)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.ready_timeout))))
+        return
+
+    for scenario in SCENARIOS:
+        for run in range(args.runs):
+            result = run_child(scenario, args.ready_timeout)
+            print(f"{scenario:>18} #{run + 1}: import {fmt(result['import'])}, lifespan {fmt(result['lifespan'])}, "
+                  f"first request {fmt(result['request'])}, ready {fmt(result['ready'])} "
+                  f"(/ready {result['status']})")
+        for name, error in result["down"].items():
+            error = " ".join(error.split())
+            print(f"{'':>18}     {name} down: {error[:100]}")
+
+
+if __name__ == "__main__":
+    main()
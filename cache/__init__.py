@@ -0,0 +1 @@
+from .ttl import TTLCache
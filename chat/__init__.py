@@ -1,3 +1,12 @@
-from .chat import llm, refine_text, refine_query, rag, find_themes
-from .vectorstore import insert_into_vectorstore, query_documents, delete_document_from_vectorstore
+from .chat import llm, refine_text, arefine_text, refine_query, arefine_query, rag, arag_stream, find_themes
+from .vectorstore import (
+    insert_into_vectorstore,
+    query_documents,
+    delete_document_from_vectorstore,
+    clone_document_vectors,
+    reindex_document
+)
+from .context import build_context, RAG_CONTEXT_TOKENS
 from .doc import do_processing, process_image_file
+from .embeddings import embeddings
+from .query_cache import query_cache
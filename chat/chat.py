@@ -1,10 +1,17 @@
+import asyncio
+import hashlib
 import json
-from typing import List
-from db.mongo import get_specific_documents
-from langchain_groq import ChatGroq
+import logging
+import os
+from typing import AsyncIterator, List
+from db.mongo import get_specific_documents, iter_pages, get_cached_themes, cache_themes
+from backends import create_llm
 from langchain_core.prompts import ChatPromptTemplate
+from metrics import timed, count_llm_tokens
 
-llm = ChatGroq(
+logger = logging.getLogger(__name__)
+
+llm = create_llm(
     model="llama-3.1-8b-instant",
     temperature=0,
     max_tokens=None,
@@ -12,6 +19,19 @@ llm = ChatGroq(
     max_retries=2,
     # other params...
 )
+
+# Max concurrent OCR cleanup calls to Groq across all ingestion jobs
+REFINE_CONCURRENCY = int(os.getenv("REFINE_CONCURRENCY", "8"))
+# Extra attempts per page on top of the client's own HTTP retries
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+
+# Max concurrent theme extraction calls to Groq
+THEME_CONCURRENCY = int(os.getenv("THEME_CONCURRENCY", "8"))
+
+_refine_semaphore = asyncio.Semaphore(REFINE_CONCURRENCY)
+_theme_semaphore = asyncio.Semaphore(THEME_CONCURRENCY)
+
 message_cleaning = [
     (
         "system",
@@ -37,6 +57,7 @@ query_refining = [
 ]
 
 rag_template = """Use the following pieces of context to answer the question at the end.
+Each piece starts with a tag like [1] and its source; cite the tags of the pieces you use.
 If you don't know the answer, just say that you don't know, don't try to make up an answer.
 Use three sentences maximum and keep the answer as concise as possible.
 Always say "thanks for asking!" at the end of the answer.
@@ -123,63 +144,167 @@ Output Format:
 Document-Level Themes:
 {document_theme_json_list}
 """
+
+
+cleaning_chain = ChatPromptTemplate.from_messages(message_cleaning) | llm
+query_chain = ChatPromptTemplate.from_messages(query_refining) | llm
+rag_chain = ChatPromptTemplate.from_template(rag_template) | llm
+page_theme_chain = ChatPromptTemplate.from_template(theme_extraction_1) | llm
+document_theme_chain = ChatPromptTemplate.from_template(theme_extraction_2) | llm
+cross_document_theme_chain = ChatPromptTemplate.from_template(theme_extraction_3) | llm
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honour the Retry-After header of rate limit (429) errors, back off exponentially otherwise."""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        retry_after = response.headers.get("retry-after")
+        try:
+            return max(float(retry_after), LLM_RETRY_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+    return LLM_RETRY_BACKOFF * 2 ** attempt
+
+
+async def _ainvoke_with_retry(chain, inputs: dict, retries: int = LLM_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            ans = await chain.ainvoke(inputs)
+            count_llm_tokens(ans)
+            return ans
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.warning("LLM call failed (%s), retrying", e)
+            await asyncio.sleep(_retry_delay(e, attempt))
+
+
 def refine_text(text):
-    prompt = ChatPromptTemplate.from_messages(message_cleaning)
-    chain = prompt | llm
-    ans = chain.invoke({
+    ans = cleaning_chain.invoke({
         "paragraph": text
     })
     return ans
 
 
+async def arefine_text(text: str) -> str:
+    """
+    Clean up the OCR text of one page. Calls from all ingestion jobs share
+    one concurrency limit so a large document cannot flood Groq.
+    """
+    async with _refine_semaphore:
+        with timed("refine_llm"):
+            ans = await _ainvoke_with_retry(cleaning_chain, {"paragraph": text})
+    return ans.content
+
+
 def refine_query(text):
-    prompt = ChatPromptTemplate.from_messages(query_refining)
-    chain = prompt | llm
-    ans = chain.invoke({
-        "question": text
-    })
+    with timed("refine_query"):
+        ans = query_chain.invoke({
+            "question": text
+        })
+    count_llm_tokens(ans)
+    return ans
+
+
+async def arefine_query(text):
+    with timed("refine_query"):
+        ans = await query_chain.ainvoke({
+            "question": text
+        })
+    count_llm_tokens(ans)
     return ans
 
 
+async def arag_stream(query, context) -> AsyncIterator[str]:
+    """Stream the RAG answer token by token as Groq generates it."""
+    with timed("rag"):
+        async for chunk in rag_chain.astream({
+            "context": context,
+            "question": query
+        }):
+            # Only the final chunk carries usage, when the model reports it at all
+            count_llm_tokens(chunk)
+            if chunk.content:
+                yield chunk.content
+
+
 def rag(query, context):
-    prompt = ChatPromptTemplate.from_template(rag_template)
-    chain = prompt | llm
-    ans = chain.invoke({
-        "context": context,
-        "question": query
-    })
+    with timed("rag"):
+        ans = rag_chain.invoke({
+            "context": context,
+            "question": query
+        })
+    count_llm_tokens(ans)
     return ans
 
 
-def find_themes(document_ids:List[str], username:str):
-    docs = get_specific_documents(username,document_ids)
-    dic = {}
+def _theme_key(stage: str, template: str, *parts) -> str:
+    # The prompt is part of the key so editing a template invalidates its results
+    payload = json.dumps([stage, llm.model_name, template, *parts])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _cached_theme_calls(chain, calls: dict, stage: str) -> dict:
+    """
+    Run `calls` ({cache key: chain inputs}) concurrently, skipping those
+    already cached in Mongo, and return {cache key: result text}. Each LLM
+    call is timed as `stage`.
+    """
+    results = await get_cached_themes(list(calls))
+    missing = [key for key in calls if key not in results]
+
+    async def run(key):
+        async with _theme_semaphore:
+            with timed(stage):
+                ans = await _ainvoke_with_retry(chain, calls[key])
+        return ans.content
+
+    computed = dict(zip(missing, await asyncio.gather(*(run(key) for key in missing))))
+    if computed:
+        await cache_themes(computed)
+    results.update(computed)
+    return results
+
+
+async def find_themes(document_ids: List[str], username: str):
+    """
+    Map-reduce theme extraction: page themes for every page, merged per
+    document, then merged across documents.
+
+    All page calls (and then all document calls) run concurrently under a
+    shared limit. Page and document results are cached in Mongo by a hash
+    of their input, so only new or changed content is sent to the LLM.
+    """
+    docs = await get_specific_documents(username, document_ids, include_pages=False)
+
+    # Pages are streamed one document at a time, only their refined text is read
+    page_calls = {}
+    page_keys = {}
     for doc in docs:
-        ls = []
-        for page in doc["pages"]:
-            prompt = ChatPromptTemplate.from_template(theme_extraction_1)
-            chain = prompt | llm
-            ans = chain.invoke({
-                "page_number": page["page"],
-                "page_text": page["refined_text"]
-            })
-            ls.append(ans.content)
-
-        prompt2 = ChatPromptTemplate.from_template(theme_extraction_2)
-        chain2 = prompt2 | llm
-        ans2 = chain2.invoke({
-            "document_title": doc["filename"],
-            "page_themes": json.dumps(ls)
-        })
-        dic[doc["document_id"]] = ans2.content
-    if len(document_ids)==1:
+        keys = []
+        async for page in iter_pages(username, doc["document_id"], fields=["refined_text"]):
+            key = _theme_key("page", theme_extraction_1, page["page"], page["refined_text"])
+            page_calls[key] = {"page_number": page["page"], "page_text": page["refined_text"]}
+            keys.append(key)
+        page_keys[doc["document_id"]] = keys
+    page_themes = await _cached_theme_calls(page_theme_chain, page_calls, "theme_map")
+
+    document_calls = {}
+    document_keys = {}
+    for doc in docs:
+        themes = json.dumps([page_themes[key] for key in page_keys[doc["document_id"]]])
+        key = _theme_key("document", theme_extraction_2, doc["filename"], themes)
+        document_calls[key] = {"document_title": doc["filename"], "page_themes": themes}
+        document_keys[doc["document_id"]] = key
+    document_themes = await _cached_theme_calls(document_theme_chain, document_calls, "theme_reduce")
+
+    dic = {document_id: document_themes[key] for document_id, key in document_keys.items()}
+    if len(document_ids) == 1:
         return dic[document_ids[0]]
     else:
-        prompt3 = ChatPromptTemplate.from_template(theme_extraction_3)
-        chain3 = prompt3 | llm
-        ans3 = chain3.invoke({
-            "document_theme_json_list": json.dumps(dic)
-        })
+        async with _theme_semaphore:
+            with timed("theme_reduce"):
+                ans3 = await _ainvoke_with_retry(cross_document_theme_chain, {
+                    "document_theme_json_list": json.dumps(dic)
+                })
         return ans3.content
-
-
@@ -0,0 +1,174 @@
+import os
+import re
+from typing import Callable, List, Optional
+
+from chunking import count_tokens
+
+# Max tokens of retrieved text put into the RAG prompt, tags included
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+
+# Longest run of shared words looked for where two chunks overlap
+_MAX_OVERLAP_WORDS = 200
+
+_WORD_RE = re.compile(r"\S+")
+
+
+class _Block:
+    """One or more retrieved chunks of a document that form a contiguous passage."""
+
+    def __init__(self, document: dict):
+        self.document_id = document.get("document_id")
+        self.document_name = document.get("document_name") or self.document_id
+        self.page = document.get("page")
+        self.paragraph = document.get("paragraph")
+        # Chunks cut from one long paragraph share page and paragraph, the part orders them
+        self.part = document.get("part") or 0
+        # Points indexed before chunking kept no end position
+        self.page_end = document.get("page_end") or self.page
+        self.paragraph_end = document.get("paragraph_end") or self.paragraph
+        self.text = document["text"].strip()
+        self.chunks = 1
+
+    @property
+    def start(self):
+        return self.page, self.paragraph, self.part
+
+    @property
+    def end(self):
+        return self.page_end, self.paragraph_end
+
+    def header(self, tag: int) -> str:
+        pages = f"p. {self.page}" if self.page == self.page_end else f"pp. {self.page}-{self.page_end}"
+        return f"[{tag}] {self.document_name}, {pages}"
+
+    def citation(self, tag: int) -> dict:
+        return {"tag": tag, "document_id": self.document_id, "document_name": self.document_name,
+                "page": self.page, "page_end": self.page_end}
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _shared_words(left: str, right: str) -> int:
+    """End offset in `right` of the longest word run that `left` ends with, 0 if none."""
+    left_words = left.split()[-_MAX_OVERLAP_WORDS:]
+    right_matches = list(_WORD_RE.finditer(right))[:_MAX_OVERLAP_WORDS]
+    for size in range(min(len(left_words), len(right_matches)), 0, -1):
+        if left_words[-size:] == [match.group() for match in right_matches[:size]]:
+            return right_matches[size - 1].end()
+    return 0
+
+
+def _touches(first: _Block, second: _Block) -> bool:
+    """Whether `second`, starting at or after `first`, continues it in the document."""
+    if first.document_id != second.document_id or None in (first.page, first.paragraph, second.page,
+                                                           second.paragraph):
+        return False
+    # Overlapping, or the next paragraph on the same page
+    if (second.page, second.paragraph) <= (first.page_end, first.paragraph_end + 1):
+        return True
+    # Chunks run across page breaks, the later one then starts with the earlier one's tail
+    return (second.page == first.page_end + 1 and second.paragraph == 1
+            and _shared_words(first.text, second.text) > 0)
+
+
+def _adjacent(block: _Block, other: _Block) -> bool:
+    return _touches(block, other) if block.start <= other.start else _touches(other, block)
+
+
+def _merge(first: _Block, second: _Block) -> _Block:
+    """Join two touching blocks in reading order, keeping the overlapping words once."""
+    if second.start < first.start:
+        first, second = second, first
+    merged = _Block({"document_id": first.document_id, "document_name": first.document_name,
+                     "page": first.page, "paragraph": first.paragraph, "part": first.part,
+                     "text": first.text})
+    if _normalized(second.text) in _normalized(first.text):
+        merged.text = first.text
+    elif _normalized(first.text) in _normalized(second.text):
+        merged.text = second.text
+    else:
+        overlap = _shared_words(first.text, second.text)
+        # Chunks stored without a part can be out of order, the overlap then runs the other way
+        reverse_overlap = 0 if overlap else _shared_words(second.text, first.text)
+        if overlap:
+            merged.text = first.text + second.text[overlap:]
+        elif reverse_overlap:
+            merged.text = second.text + first.text[reverse_overlap:]
+        else:
+            merged.text = f"{first.text}\n\n{second.text}"
+    merged.page_end, merged.paragraph_end = max(first.end, second.end)
+    merged.chunks = first.chunks + second.chunks
+    return merged
+
+
+def _render(blocks: List[_Block]) -> str:
+    return "\n\n".join(f"{block.header(tag)}\n{block.text}" for tag, block in enumerate(blocks, start=1))
+
+
+def _truncate(block: _Block, budget: int, counter: Callable[[str], int]) -> Optional[_Block]:
+    """Cut a block on words so it fits the budget on its own, None if not even its header does."""
+    words = block.text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        block.text = " ".join(words[:middle]) + " …"
+        if counter(_render([block])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    if not low:
+        return None
+    block.text = " ".join(words[:low]) + " …"
+    return block
+
+
+def build_context(documents: List[dict], budget: int = RAG_CONTEXT_TOKENS,
+                  counter: Callable[[str], int] = count_tokens) -> dict:
+    """
+    Turn retrieved chunks (query_documents results, best first) into a compact
+    RAG context of at most `budget` tokens.
+
+    Each passage is prefixed by a citation tag with its source, "[1] report.pdf, p. 3".
+    Chunks whose text is already in the context are dropped, and chunks that
+    overlap or directly follow one another in a document are merged into one
+    passage with the shared words kept once. Passages are packed in relevance
+    order; one that does not fit is skipped, so a smaller later one may still
+    be used. A first passage over the whole budget is cut to fit.
+
+    Returns {"text": str, "tokens": int, "chunks": int, "citations": [{"tag", "document_id",
+    "document_name", "page", "page_end"}]}, with `chunks` the number of
+    retrieved chunks the context covers.
+    """
+    blocks: List[_Block] = []
+    for document in documents:
+        block = _Block(document)
+        if not block.text:
+            continue
+        text = _normalized(block.text)
+        if any(text in _normalized(other.text) for other in blocks):
+            continue
+
+        # Fold in every passage the chunk continues; the result takes the best rank among them.
+        # Passages never touch each other, so one pass finds them all.
+        touching = [i for i, other in enumerate(blocks) if _adjacent(other, block)]
+        for other in sorted((blocks[i] for i in touching), key=lambda other: other.start):
+            block = _merge(other, block)
+        candidate = [other for i, other in enumerate(blocks) if i not in touching]
+        candidate.insert(touching[0] if touching else len(candidate), block)
+
+        if counter(_render(candidate)) <= budget:
+            blocks = candidate
+        elif not blocks:
+            truncated = _truncate(block, budget, counter)
+            if truncated is not None:
+                blocks = [truncated]
+
+    text = _render(blocks)
+    return {
+        "text": text,
+        "tokens": counter(text) if blocks else 0,
+        "chunks": sum(block.chunks for block in blocks),
+        "citations": [block.citation(tag) for tag, block in enumerate(blocks, start=1)],
+    }
@@ -1,97 +1,176 @@
-import io
+import asyncio
+import logging
+import os
 import uuid
 import re
-import pytesseract
-import pymupdf
-from PIL import Image
-from fastapi import UploadFile
+from datetime import datetime, timezone
+from typing import Callable, Optional
 
+from ocr import iter_pdf_pages, ocr_image_file, pdf_page_count
 from schema import DocumentModel
-from .chat import refine_text
-from db.mongo import insert_into
+from .chat import arefine_text
+from db.mongo import insert_into, save_page, update_document, mongo_delete_document
+from metrics import timed, observe_stages, PAGES
 
+logger = logging.getLogger(__name__)
 
-async def do_processing(file: UploadFile, username: str):
-    doc = pymupdf.Document(stream=file.file.read())
-    document_id = str(uuid.uuid4())
-    pages_data = []
+# Pages whose OCR confidence (or text layer quality) reaches this 0..1 score
+# skip the LLM cleanup pass. Anything above 1 refines every page.
+REFINE_CONFIDENCE_THRESHOLD = float(os.getenv("REFINE_CONFIDENCE_THRESHOLD", "0.9"))
 
-    for page_num, page in enumerate(doc, start=1):
-        pix = page.get_pixmap()
-        img = pix.pil_image()
-        text = pytesseract.image_to_string(img)
+# Called as progress(pages_done, total_pages) after every finished page
+ProgressCallback = Callable[[int, int], None]
+# Called with the document id as soon as the document's header is stored
+DocumentCallback = Callable[[str], None]
 
-        # Refine the entire page at once
 
-        refined_text = refine_text(text).content
-        print(refined_text)
-        # Optional: split the refined page into paragraphs
-        refined_paragraphs = [
-            p.strip() for p in re.split(r"\n\s*\n", refined_text) if p.strip()
-        ]
-        para_data = [
-            {"paragraph": i + 1, "refined_text": p}
-            for i, p in enumerate(refined_paragraphs)
-        ]
-
-        pages_data.append({
-            "page": page_num,
-            "original_text": text,
-            "refined_text": refined_text,
-            "paragraphs": para_data
-        })
+def _split_paragraphs(refined_text: str):
+    refined_paragraphs = [
+        p.strip() for p in re.split(r"\n\s*\n", refined_text) if p.strip()
+    ]
+    return [
+        {"paragraph": i + 1, "refined_text": p}
+        for i, p in enumerate(refined_paragraphs)
+    ]
 
-    mongo_data: DocumentModel = {
+
+async def _refine_page(ocr_page: dict):
+    """Clean up one extracted page, unless its text is already good enough."""
+    original_text = ocr_page["original_text"]
+    refined = ocr_page["confidence"] < REFINE_CONFIDENCE_THRESHOLD
+    refined_text = await arefine_text(original_text) if refined else original_text.strip()
+    # Extraction ran in an OCR worker, its timings are recorded here in the app process
+    observe_stages(ocr_page.get("timings", {}))
+    PAGES.labels(extraction=ocr_page["extraction"], refined=str(refined).lower()).inc()
+
+    return {
+        "page": ocr_page["page"],
+        "extraction": ocr_page["extraction"],
+        "confidence": ocr_page["confidence"],
+        "refined": refined,
+        "original_text": original_text,
+        "refined_text": refined_text,
+        "paragraphs": _split_paragraphs(refined_text)
+    }
+
+
+def _document_header(path: str, username: str, document_id: str, filename: str, content_hash: Optional[str],
+                     page_count: int):
+    return {
         "username": username,
         "document_id": document_id,
-        "filename": file.filename,
-        "pages": pages_data
+        "filename": filename,
+        "content_hash": content_hash,
+        "size_bytes": os.path.getsize(path),
+        "page_count": page_count,
+        "status": "processing",
+        "created_at": datetime.now(timezone.utc),
     }
 
-    print("inserting")
-    await insert_into(mongo_data)
 
-    return {"status": "ok", "document_id": document_id, "pages": len(pages_data), "document": mongo_data,
-            "filename": file.filename}
+async def _discard_document(username: str, document_id: str):
+    """Remove the header and pages stored so far for a document whose processing failed."""
+    try:
+        await mongo_delete_document(username, document_id)
+    except Exception:
+        logger.exception("Removing partly processed document %s failed", document_id)
 
 
-async def process_image_file(file: UploadFile, username: str):
-    image_data = await file.read()
-    image = Image.open(io.BytesIO(image_data))
-    original_text = pytesseract.image_to_string(image)
+def _refine_counts(pages_data):
+    pages_refined = sum(1 for page in pages_data if page["refined"])
+    return {"pages_refined": pages_refined, "pages_skipped": len(pages_data) - pages_refined}
 
-    # Refine the entire image text (treated as one page)
-    refined_text = refine_text(original_text).content
-
-    # Split refined text into paragraphs
-    refined_paragraphs = [
-        p.strip() for p in re.split(r"\n\s*\n", refined_text) if p.strip()
-    ]
-    para_data = [
-        {"paragraph": i + 1, "refined_text": p}
-        for i, p in enumerate(refined_paragraphs)
-    ]
 
+async def do_processing(path: str, filename: str, username: str, progress: Optional[ProgressCallback] = None,
+                        content_hash: Optional[str] = None, on_document: Optional[DocumentCallback] = None):
+    total_pages = await asyncio.to_thread(pdf_page_count, path)
     document_id = str(uuid.uuid4())
-    page_data = {
-        "page": 1,
-        "original_text": original_text,
-        "refined_text": refined_text,
-        "paragraphs": para_data
+    pages_done = 0
+
+    # The header goes in first, every page is written as soon as it is refined
+    logger.debug("Inserting document %s (%s, %d pages)", document_id, filename, total_pages)
+    with timed("mongo_insert"):
+        await insert_into(_document_header(path, username, document_id, filename, content_hash, total_pages))
+    if on_document:
+        on_document(document_id)
+
+    async def refine_page(ocr_page: dict):
+        nonlocal pages_done
+        # Refine the entire page at once
+        page_data = await _refine_page(ocr_page)
+        with timed("mongo_insert"):
+            await save_page(username, document_id, page_data)
+        pages_done += 1
+        if progress:
+            progress(pages_done, total_pages)
+        return page_data
+
+    # Pages are extracted in parallel on the process pool, in order. Pages
+    # with a usable text layer skip rendering and OCR entirely. Each page is
+    # sent to the LLM as soon as its text is ready, so OCR and cleanup overlap.
+    tasks = []
+    try:
+        async for ocr_page in iter_pdf_pages(path, total_pages):
+            tasks.append(asyncio.create_task(refine_page(ocr_page)))
+        pages_data = list(await asyncio.gather(*tasks))
+        await update_document(username, document_id, {"status": "ready", **_refine_counts(pages_data)})
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled page writes settle, then leave no half-stored document behind
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _discard_document(username, document_id)
+        raise
+
+    mongo_data: DocumentModel = {
+        "username": username,
+        "document_id": document_id,
+        "filename": filename,
+        "content_hash": content_hash,
+        "pages": pages_data,
+        **_refine_counts(pages_data)
     }
 
+    return {"status": "ok", "document_id": document_id, "pages": len(pages_data), "document": mongo_data,
+            "filename": filename, **_refine_counts(pages_data)}
+
+
+async def process_image_file(path: str, filename: str, username: str, progress: Optional[ProgressCallback] = None,
+                             content_hash: Optional[str] = None, on_document: Optional[DocumentCallback] = None):
+    # The entire image text is treated as one page
+    page_data = await _refine_page(await ocr_image_file(path))
+
+    document_id = str(uuid.uuid4())
+    if progress:
+        progress(1, 1)
+
+    with timed("mongo_insert"):
+        await insert_into({
+            **_document_header(path, username, document_id, filename, content_hash, 1),
+            "status": "ready",
+            **_refine_counts([page_data])
+        })
+        if on_document:
+            on_document(document_id)
+        try:
+            await save_page(username, document_id, page_data)
+        except BaseException:
+            await _discard_document(username, document_id)
+            raise
+
     mongo_data = {
         "username": username,
         "document_id": document_id,
-        "filename": file.filename,
-        "pages": [page_data]
+        "filename": filename,
+        "content_hash": content_hash,
+        "pages": [page_data],
+        **_refine_counts([page_data])
     }
 
-    await insert_into(mongo_data)
-
     return {
         "status": "ok",
         "document_id": document_id,
-        "filename": file.filename,
-        "document": mongo_data
+        "filename": filename,
+        "document": mongo_data,
+        **_refine_counts([page_data])
     }
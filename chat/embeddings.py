@@ -1,8 +1,210 @@
+import hashlib
 import os
-from langchain_cloudflare.embeddings import CloudflareWorkersAIEmbeddings
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Dict, List
 
-embeddings = CloudflareWorkersAIEmbeddings(
-    account_id=os.environ['ACCOUNT_ID'],
-    api_token=os.environ['API_TOKEN'],
-    model_name=os.environ['MODEL_NAME'],
-)
\ No newline at end of file
+from langchain_core.embeddings import Embeddings
+
+from backends import create_embeddings, registry
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Seconds between writes of the last_used times of cache hits, which are batched in between
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "30"))
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+# Pending last_used updates that trigger a write before the interval is over
+_MAX_PENDING_TOUCHES = 10000
+
+# The total vector size lives in the database, kept exact by triggers, so every
+# process sharing the file evicts against the same number
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS embeddings ("
+    "model TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+    "PRIMARY KEY (model, key))",
+    "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)",
+    "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO cache_size VALUES (0, (SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings))",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings BEGIN "
+    "UPDATE cache_size SET bytes = bytes + LENGTH(NEW.vector) WHERE id = 0; END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF vector ON embeddings BEGIN "
+    "UPDATE cache_size SET bytes = bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector) WHERE id = 0; END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings BEGIN "
+    "UPDATE cache_size SET bytes = bytes - LENGTH(OLD.vector) WHERE id = 0; END",
+)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that keeps every computed vector in a local SQLite store.
+
+    Entries are keyed by (model name, SHA-256 of the text) and stored as
+    float32 blobs. Lookups are batched and only misses reach the wrapped
+    model. Once the stored vectors exceed `max_bytes` the least recently
+    used entries are evicted. The file may be shared by several processes.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str = EMBEDDING_CACHE_PATH,
+                 max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+                 touch_interval: float = EMBEDDING_CACHE_TOUCH_INTERVAL):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> last_used of cache hits not written yet
+        self._touched: Dict[bytes, float] = {}
+        self._touches_written = time.time()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    @staticmethod
+    def _key(text: str, kind: str) -> bytes:
+        return hashlib.sha256(f"{kind}\0{text}".encode()).digest()
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so processes do not interleave
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _size(self) -> int:
+        return self._conn.execute("SELECT bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _write_touches(self):
+        """Write the batched last_used times of cache hits, inside a transaction."""
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+            [(used, self.model_name, key) for key, used in self._touched.items()],
+        )
+        self._touched.clear()
+        self._touches_written = time.time()
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    (self.model_name, *batch),
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                    self._touched[key] = now
+            # Hits only reorder eviction, so their writes are batched instead of one per lookup
+            if self._touched and (len(self._touched) >= _MAX_PENDING_TOUCHES
+                                  or now - self._touches_written >= self.touch_interval):
+                with self._transaction():
+                    self._write_touches()
+        return found
+
+    def _store(self, keys: List[bytes], vectors: List[List[float]]):
+        now = time.time()
+        rows = [(self.model_name, key, array("f", vector).tobytes(), now) for key, vector in zip(keys, vectors)]
+        with self._lock, self._transaction():
+            self._write_touches()
+            self._conn.executemany(
+                "INSERT INTO embeddings VALUES (?, ?, ?, ?) ON CONFLICT (model, key) "
+                "DO UPDATE SET vector = excluded.vector, last_used = excluded.last_used",
+                rows,
+            )
+            if self._size() > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Free down to 90% of the budget so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        size = self._size()
+        while size > target:
+            rows = self._conn.execute(
+                "SELECT model, key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            freed = 0
+            victims = []
+            for model, key, length in rows:
+                victims.append((model, key))
+                freed += length
+                if size - freed <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND key = ?", victims)
+            size = self._size()
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+
+        # Embed every distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += sum(1 for key in keys if key in missing)
+
+        if missing:
+            missing_texts = list(missing.values())
+            if kind == "query":
+                vectors = [self.underlying.embed_query(text) for text in missing_texts]
+            else:
+                vectors = self.underlying.embed_documents(missing_texts)
+            self._store(list(missing), vectors)
+            found.update(zip(missing, vectors))
+
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def close(self):
+        with self._lock:
+            if self._touched:
+                with self._transaction():
+                    self._write_touches()
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self._size()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _create_embeddings() -> CachedEmbeddings:
+    model_embeddings = create_embeddings()
+    return CachedEmbeddings(model_embeddings, model_name=model_embeddings.model_name)
+
+
+registry.register("embeddings", _create_embeddings, close=lambda cached: cached.close())
+
+embeddings = registry.lazy("embeddings")
@@ -0,0 +1,45 @@
+import os
+from typing import Hashable, List, Optional
+
+from cache import TTLCache
+from db.mongo import get_corpus_generation, bump_corpus_generation
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+
+
+class QueryCache:
+    """
+    Per-tenant cache of /query responses.
+
+    Keys carry the user's corpus generation, which is bumped whenever their
+    vectors change. Entries computed against an older corpus can then never
+    be hit again and simply age out of the LRU. The generation is a Mongo
+    counter read for every key, so a change made by one worker invalidates
+    the cached answers of all of them.
+    """
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def key(self, username: str, query: str, document_ids: Optional[List[str]] = None,
+                  **params) -> Hashable:
+        normalized = " ".join(query.lower().split())
+        scope = tuple(sorted(set(document_ids))) if document_ids else None
+        generation = await get_corpus_generation(username)
+        return username, generation, normalized, scope, tuple(sorted(params.items()))
+
+    def get(self, key: Hashable):
+        return self._cache.get(key)
+
+    def set(self, key: Hashable, value):
+        self._cache.set(key, value)
+
+    async def invalidate(self, username: str):
+        await bump_corpus_generation(username)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+query_cache = QueryCache()
@@ -1,91 +1,289 @@
-from typing import List, Tuple, Optional
+import asyncio
+import hashlib
+import logging
+import uuid
+from typing import Dict, List, Optional
 
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
 from qdrant_client.embed import models
-from qdrant_client.http.models import Distance, VectorParams, KeywordIndexType, KeywordIndexParams
+from backends import create_qdrant_client, registry
+from db.qdrant import ensure_collection, search_points, write_points, WriteProgress, BM25SparseEmbeddings
 from .embeddings import embeddings
+from .query_cache import query_cache
+from chunking import chunk_pages
+from metrics import timed, TOKENS
 from schema import DocumentModel
 from langchain_core.documents import Document
-from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny, PointStruct, FilterSelector, \
+    PointIdsList
 
 import os
 
-# Use persistent client — replace host/port as needed
-client = QdrantClient(url=os.getenv("Q_URL"), api_key=os.getenv("Q_API_KEY"), prefer_grpc=True)
+logger = logging.getLogger(__name__)
 
 collection_name = "my_collection"
 
-# Only create collection if it doesn't exist
-if collection_name not in [col.name for col in client.get_collections().collections]:
-    client.create_collection(
-        collection_name=collection_name,
-        vectors_config=VectorParams(size=384, distance=Distance.COSINE)
-    )
+# Default for queries that do not pick a mode: "dense", "sparse" or "hybrid"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+registry.register(
+    "qdrant",
+    create_qdrant_client,
+    close=lambda qdrant: qdrant.close(),
+    check=lambda qdrant: qdrant.get_collection(collection_name),
+)
+# The collection layout is checked once per process, on first use or during warmup
+registry.register("qdrant_collection", lambda: ensure_collection(registry.get("qdrant"), collection_name))
+
+client = registry.lazy("qdrant")
+
+sparse_embeddings = BM25SparseEmbeddings()
+
+
+def hybrid_enabled() -> bool:
+    """
+    Whether the collection has the sparse vector that sparse and hybrid retrieval need.
+    Blocks on Qdrant when the layout was not checked yet, call it off the event loop.
+    """
+    return registry.get("qdrant_collection")
+
+
+# Point ids are uuid5(CHUNK_NAMESPACE, chunk_id), so writing a chunk twice overwrites it
+CHUNK_NAMESPACE = uuid.UUID("5b0c1f8e-3d1a-4c8e-9a57-2f64c1d0e7b3")
+
+
+def point_id(chunk_id: str) -> str:
+    return str(uuid.uuid5(CHUNK_NAMESPACE, chunk_id))
+
 
-vector_store = QdrantVectorStore(client=client, collection_name=collection_name, embedding=embeddings)
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
 
 
-def insert_into_vectorstore(documents: list[DocumentModel], username: str):
+def document_chunks(document: DocumentModel, username: str) -> List[Document]:
+    """Chunk a document and wrap every chunk with its vector store metadata."""
+    docs = []
+    parts = {}
+    for chunk in chunk_pages(document.pages):
+        # Chunks starting in the same paragraph (a split long one) are numbered
+        start = (chunk.page, chunk.paragraph)
+        part = parts[start] = parts.get(start, -1) + 1
+        docs.append(
+            Document(
+                page_content=chunk.text,
+                metadata={
+                    "group_id": username,  # Multitenancy partition key
+                    "document_id": document.document_id,
+                    "page": chunk.page,
+                    "paragraph": chunk.paragraph,
+                    "page_end": chunk.page_end,
+                    "paragraph_end": chunk.paragraph_end,
+                    "part": part,  # Orders the chunks of a split paragraph, they share page and paragraph
+                    "token_count": chunk.token_count,
+                    "filename": document.filename,
+                    "chunk_id": f"{document.document_id}-{chunk.page}-{chunk.paragraph}-{part}",  # <-- uniquely
+                    # identifies a chunk
+                    "chunk_hash": chunk_hash(chunk.text),  # Re-embed only when this changes
+                }
+            )
+        )
+        TOKENS.labels(kind="chunked").inc(chunk.token_count)
+    return docs
+
+
+async def insert_into_vectorstore(documents: list[DocumentModel], username: str,
+                                  progress: Optional[WriteProgress] = None) -> dict:
+    """
+    Chunk, embed and store documents in batches. Returns the write report:
+    chunk and batch counts, failures, retries and throughput.
+    """
     docs_to_add = []
 
     for document in documents:
-        for page_num, page in enumerate(document.pages, start=1):
-            for para_num, paragraph in enumerate(page.paragraphs, start=1):
-                docs_to_add.append(
-                    Document(
-                        page_content=paragraph.refined_text,
-                        metadata={
-                            "group_id": username,  # Multitenancy partition key
-                            "document_id": document.document_id,
-                            "page": page_num,
-                            "paragraph": para_num,
-                            "filename": document.filename,
-                            "chunk_id": f"{document.document_id}-{page_num}-{para_num}"  # <-- uniquely identifies a
-                            # chunk
-                        }
-                    )
-                )
-
-    # Let Qdrant handle point UUIDs automatically
-    print(docs_to_add)
-    vector_store.add_documents(docs_to_add)
-
-
-def delete_document_from_vectorstore(document_id: str, username: str):
-    vector_store.delete(
-        ids=Filter(
-            must=[
+        docs_to_add.extend(document_chunks(document, username))
+
+    report = await write_points(
+        client,
+        collection_name,
+        docs_to_add,
+        dense=embeddings,
+        sparse=sparse_embeddings if await asyncio.to_thread(hybrid_enabled) else None,
+        ids=[point_id(doc.metadata["chunk_id"]) for doc in docs_to_add],
+        progress=progress,
+    )
+    await query_cache.invalidate(username)
+    return report
+
+
+def _stored_chunk_hashes(document_id: str, username: str, batch_size: int = 1000) -> Dict[str, Optional[str]]:
+    """Point id -> chunk_hash of every stored chunk of a document, payload only."""
+    stored = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=Filter(must=[
                 FieldCondition(key="metadata.group_id", match=MatchValue(value=username)),
                 FieldCondition(key="metadata.document_id", match=MatchValue(value=document_id)),
-            ]
+            ]),
+            limit=batch_size,
+            offset=offset,
+            with_payload=["metadata.chunk_hash"],
+            with_vectors=False,
         )
+        for point in points:
+            stored[str(point.id)] = point.payload.get("metadata", {}).get("chunk_hash")
+        if offset is None:
+            return stored
+
+
+async def reindex_document(document: DocumentModel, username: str) -> dict:
+    """
+    Bring the stored chunks of a document in line with its current pages.
+
+    Only chunks that are new or whose text changed are embedded and written;
+    chunks that no longer exist are deleted. Points stored before chunk ids
+    were deterministic have no matching id and are replaced.
+    """
+    docs = document_chunks(document, username)
+    ids = [point_id(doc.metadata["chunk_id"]) for doc in docs]
+    stored = await asyncio.to_thread(_stored_chunk_hashes, document.document_id, username)
+
+    changed = [(point, doc) for point, doc in zip(ids, docs) if stored.get(point) != doc.metadata["chunk_hash"]]
+    removed = list(set(stored) - set(ids))
+
+    report = await write_points(
+        client,
+        collection_name,
+        [doc for _, doc in changed],
+        dense=embeddings,
+        sparse=sparse_embeddings if await asyncio.to_thread(hybrid_enabled) else None,
+        ids=[point for point, _ in changed],
     )
+    if removed:
+        await asyncio.to_thread(
+            client.delete, collection_name=collection_name, points_selector=PointIdsList(points=removed)
+        )
+    await query_cache.invalidate(username)
 
+    added = sum(1 for point, _ in changed if point not in stored)
+    return {
+        "document_id": document.document_id,
+        "chunks": len(docs),
+        "added": added,
+        "updated": len(changed) - added,
+        "removed": len(removed),
+        "unchanged": len(docs) - len(changed),
+        "failed": report["chunks_failed"],
+    }
 
 
-def delete_user_vectors_from_vectorstore(username: str):
-    vector_store.delete(
-        filter=Filter(
+async def delete_document_from_vectorstore(document_id: str, username: str):
+    await asyncio.to_thread(
+        client.delete,
+        collection_name=collection_name,
+        points_selector=FilterSelector(filter=Filter(
             must=[
-                FieldCondition(key="group_id", match=MatchValue(value=username))
+                FieldCondition(key="metadata.group_id", match=MatchValue(value=username)),
+                FieldCondition(key="metadata.document_id", match=MatchValue(value=document_id)),
             ]
+        ))
+    )
+    await query_cache.invalidate(username)
+
+
+
+def _clone_points(
+        source_username: str,
+        source_document_id: str,
+        username: str,
+        document_id: str,
+        filename: str,
+        batch_size: int
+):
+    source_filter = Filter(
+        must=[
+            FieldCondition(key="metadata.group_id", match=MatchValue(value=source_username)),
+            FieldCondition(key="metadata.document_id", match=MatchValue(value=source_document_id)),
+        ]
+    )
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=source_filter,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
         )
+        cloned = []
+        for point in points:
+            metadata = dict(point.payload["metadata"])
+            metadata.update(
+                group_id=username,
+                document_id=document_id,
+                filename=filename,
+                chunk_id=metadata["chunk_id"].replace(source_document_id, document_id, 1),
+            )
+            cloned.append(PointStruct(
+                id=point_id(metadata["chunk_id"]),
+                vector=point.vector,
+                payload={**point.payload, "metadata": metadata},
+            ))
+        if cloned:
+            client.upsert(collection_name=collection_name, points=cloned)
+        if offset is None:
+            break
+
+
+async def clone_document_vectors(
+        source_username: str,
+        source_document_id: str,
+        username: str,
+        document_id: str,
+        filename: str,
+        batch_size: int = 256
+):
+    """
+    Copy the stored vectors of a document to a new owner and document id,
+    without embedding anything again.
+    """
+    await asyncio.to_thread(
+        _clone_points, source_username, source_document_id, username, document_id, filename, batch_size
+    )
+    await query_cache.invalidate(username)
+
+
+async def delete_user_vectors_from_vectorstore(username: str):
+    await asyncio.to_thread(
+        client.delete,
+        collection_name=collection_name,
+        points_selector=FilterSelector(filter=Filter(
+            must=[
+                FieldCondition(key="metadata.group_id", match=MatchValue(value=username))
+            ]
+        ))
     )
+    await query_cache.invalidate(username)
 
 
 def query_documents(
         query: str,
         username: str,
         document_ids: Optional[List[str]] = None,
-        k: int = 5
-) -> List[Tuple[str, float, str]]:
+        k: int = 5,
+        mode: Optional[str] = None
+) -> List[dict]:
     """
     Perform a similarity search for a user across one or more documents.
 
     If `document_ids` is None or empty, the search includes all documents for that user.
+    `mode` is "dense", "sparse" or "hybrid" (default RETRIEVAL_MODE). Collections
+    without the sparse vector always search dense.
 
-    Returns a list of (chunk, score, document_id) tuples.
+    Returns the matching chunks, best first, as dicts with "document_id",
+    "document_name", "page", "paragraph", "page_end", "paragraph_end", "part"
+    and "text". Scores are not returned.
     """
     must_conditions = [FieldCondition(key="metadata.group_id", match=MatchValue(value=username))]
 
@@ -94,20 +292,34 @@ def query_documents(
             FieldCondition(key="metadata.document_id", match=MatchAny(any=document_ids))
         )
 
-    results = vector_store.similarity_search_with_score(
-        query=query,
-        k=k,
-        filter=Filter(must=must_conditions)
-    )
+    mode = mode or RETRIEVAL_MODE
+    if not hybrid_enabled():
+        mode = "dense"
+
+    with timed("retrieval"):
+        results = search_points(
+            client,
+            collection_name,
+            query,
+            Filter(must=must_conditions),
+            dense=embeddings,
+            sparse=sparse_embeddings,
+            mode=mode,
+            k=k,
+        )
 
-    print(results)
+    logger.debug("%s search for %r returned %d chunks", mode, query, len(results))
     return [
         {
-            "document_id": doc.metadata.get("document_id"),
-            "document_name": doc.metadata.get("filename"),  # filename is present
-            "page": doc.metadata.get("page"),
-            "paragraph": doc.metadata.get("paragraph"),
-            "text": doc.page_content,
+            "document_id": point.payload["metadata"].get("document_id"),
+            "document_name": point.payload["metadata"].get("filename"),  # filename is present
+            "page": point.payload["metadata"].get("page"),
+            "paragraph": point.payload["metadata"].get("paragraph"),
+            "page_end": point.payload["metadata"].get("page_end"),
+            "paragraph_end": point.payload["metadata"].get("paragraph_end"),
+            # Chunks stored before parts were recorded count as the first part
+            "part": point.payload["metadata"].get("part", 0),
+            "text": point.payload["page_content"],
         }
-        for doc, score in results
+        for point in results
     ]
@@ -0,0 +1 @@
+from .chunker import chunk_pages, count_tokens, CHUNK_TARGET_TOKENS, CHUNK_MIN_TOKENS, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from typing import Callable, List
+
+from schema.types import Chunk, Page
+
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "256"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+# Stay well under the 512 token input limit of the embedding model
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+TokenCounter = Callable[[str], int]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate subword token count without loading a tokenizer.
+
+    Punctuation counts as one token and a word as one token per started six
+    characters. This tracks WordPiece/BPE counts on English prose closely
+    enough to size chunks and prompts.
+    """
+    return sum(math.ceil(len(token) / 6) for token in _TOKEN_RE.findall(text))
+
+
+def _split_long(text: str, max_tokens: int, counter: TokenCounter) -> List[str]:
+    """Split text over max_tokens on sentences, then on words."""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for sentence in _SENTENCE_RE.split(text):
+        sentence_tokens = counter(sentence)
+        if sentence_tokens > max_tokens:
+            # A run-on "sentence" (tables, OCR noise) is cut on words
+            words = sentence.split()
+            sentence_parts, part = [], []
+            for word in words:
+                if part and counter(" ".join(part + [word])) > max_tokens:
+                    sentence_parts.append(" ".join(part))
+                    part = []
+                part.append(word)
+            sentence_parts.append(" ".join(part))
+        else:
+            sentence_parts = [sentence]
+
+        for part in sentence_parts:
+            part_tokens = counter(part)
+            if current and current_tokens + part_tokens > max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _overlap_tail(text: str, overlap_tokens: int, counter: TokenCounter) -> str:
+    """The last words of text, up to overlap_tokens."""
+    words = text.split()
+    tail = []
+    tokens = 0
+    for word in reversed(words):
+        tokens += counter(word)
+        if tokens > overlap_tokens:
+            break
+        tail.append(word)
+    return " ".join(reversed(tail))
+
+
+def chunk_pages(
+        pages: List[Page],
+        target_tokens: int = CHUNK_TARGET_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        counter: TokenCounter = count_tokens,
+) -> List[Chunk]:
+    """
+    Group the paragraphs of a document into chunks of about target_tokens.
+
+    Paragraphs are packed in reading order, across page breaks, so headers,
+    page numbers and other short fragments are merged with their neighbours.
+    A chunk is closed once it reaches target_tokens, or earlier if the next
+    paragraph would push it over max_tokens. Paragraphs longer than
+    max_tokens are split on sentences. Each chunk after the first starts
+    with up to overlap_tokens of the previous one, and a final chunk under
+    min_tokens is folded into the one before it when that fits.
+
+    Every chunk records the page/paragraph where its own text starts and ends.
+    """
+    # (page, paragraph, text, tokens) units in reading order
+    units = []
+    for page in pages:
+        for paragraph in page.paragraphs:
+            text = paragraph.refined_text.strip()
+            if not text:
+                continue
+            for piece in _split_long(text, max_tokens - overlap_tokens, counter):
+                units.append((page.page, paragraph.paragraph, piece, counter(piece)))
+
+    chunks: List[Chunk] = []
+    current = []
+    current_tokens = 0
+
+    def close():
+        nonlocal current, current_tokens
+        first, last = current[0], current[-1]
+        overlap = ""
+        if chunks and overlap_tokens:
+            overlap = _overlap_tail(chunks[-1].text, overlap_tokens, counter)
+        body = "\n\n".join(unit[2] for unit in current)
+        chunks.append(Chunk(
+            text=f"{overlap} {body}" if overlap else body,
+            token_count=current_tokens + (counter(overlap) if overlap else 0),
+            overlap_tokens=counter(overlap) if overlap else 0,
+            page=first[0],
+            paragraph=first[1],
+            page_end=last[0],
+            paragraph_end=last[1],
+        ))
+        current, current_tokens = [], 0
+
+    for unit in units:
+        tokens = unit[3]
+        if current and current_tokens + tokens > max_tokens - overlap_tokens:
+            close()
+        current.append(unit)
+        current_tokens += tokens
+        if current_tokens >= target_tokens:
+            close()
+
+    if current:
+        if chunks and current_tokens < min_tokens and chunks[-1].token_count + current_tokens <= max_tokens:
+            last = chunks.pop()
+            body = "\n\n".join(unit[2] for unit in current)
+            chunks.append(last.model_copy(update={
+                "text": f"{last.text}\n\n{body}",
+                "token_count": last.token_count + current_tokens,
+                "page_end": current[-1][0],
+                "paragraph_end": current[-1][1],
+            }))
+        else:
+            close()
+
+    return chunks
@@ -1 +1,23 @@
-from .mongo import insert_into, get_all_documents, get_specific_documents, mongo_delete_document, get_single_documents
+from .mongo import (
+    insert_into,
+    get_all_documents,
+    get_specific_documents,
+    mongo_delete_document,
+    get_single_documents,
+    get_document_by_hash,
+    mark_indexed,
+    ensure_indexes,
+    get_cached_themes,
+    cache_themes,
+    get_corpus_generation,
+    bump_corpus_generation,
+    save_job,
+    get_job,
+    update_document,
+    save_page,
+    iter_pages,
+    get_pages,
+    clone_pages,
+    iter_document_listing,
+    LISTING_OPTIONAL_FIELDS
+)
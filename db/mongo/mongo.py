@@ -1,42 +1,266 @@
-from typing import List
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, UpdateOne
 import os
 
-client = MongoClient(os.getenv("CONNECTION_STRING"))
-db = client["user_text"]
-collection = db["assignment"]
+from backends import create_mongo_client, registry
+
+logger = logging.getLogger(__name__)
+
+# Connection pool sizing, shared by every request of this process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Seconds a cached theme extraction result is kept after it was computed
+THEME_CACHE_TTL = int(os.getenv("THEME_CACHE_TTL", "2592000"))
+# Seconds an ingestion job stays pollable after its last update
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", "604800"))
+
+
+def _create_client():
+    return create_mongo_client(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    )
+
+
+async def _ping(mongo):
+    await mongo["admin"].command("ping")
+
+
+async def _close(mongo):
+    await mongo.close()
+
+
+async def _setup(mongo):
+    await ensure_indexes()
+
+
+registry.register("mongo", _create_client, close=_close, check=_ping, setup=_setup)
+
+# Resolved on first use, in the process that uses them
+client = registry.lazy("mongo")
+# One lightweight header per document, its pages live in page_collection.
+# Documents ingested before the split still carry an embedded "pages" list.
+collection = registry.lazy("mongo", lambda mongo: mongo["user_text"]["assignment"])
+page_collection = registry.lazy("mongo", lambda mongo: mongo["user_text"]["pages"])
+theme_collection = registry.lazy("mongo", lambda mongo: mongo["user_text"]["theme_cache"])
+# One counter per user, bumped whenever their vectors change; shared by every worker
+corpus_collection = registry.lazy("mongo", lambda mongo: mongo["user_text"]["corpus_generation"])
+# Ingestion job status, written by the worker running the job and read by any worker
+job_collection = registry.lazy("mongo", lambda mongo: mongo["user_text"]["ingest_jobs"])
+
+PAGE_BATCH_SIZE = 500
+
+
+# Header fields the document listing may return on request, on top of its defaults
+LISTING_OPTIONAL_FIELDS = ("content_hash", "status", "indexed", "pages_refined", "pages_skipped")
+
+
+async def ensure_indexes():
+    await collection.create_index([("username", ASCENDING), ("document_id", ASCENDING)], unique=True)
+    await collection.create_index("content_hash", sparse=True)
+    await page_collection.create_index(
+        [("username", ASCENDING), ("document_id", ASCENDING), ("page", ASCENDING)], unique=True
+    )
+    await theme_collection.create_index("cached_at", expireAfterSeconds=THEME_CACHE_TTL)
+    await job_collection.create_index("saved_at", expireAfterSeconds=INGEST_JOB_TTL)
 
 
 async def insert_into(data):
     try:
-        res = collection.insert_one(data)
-        print(res)
-    except Exception as e:
-        print(e)
-        raise e
+        res = await collection.insert_one(data)
+        logger.debug("Inserted %s", res.inserted_id)
+    except Exception:
+        logger.exception("Inserting document %s failed", data.get("document_id"))
+        raise
+
+
+async def update_document(username: str, document_id: str, fields: dict):
+    return await collection.update_one({"username": username, "document_id": document_id}, {"$set": fields})
+
+
+async def save_page(username: str, document_id: str, page: dict):
+    """Write (or overwrite) a single page of a document."""
+    await page_collection.replace_one(
+        {"username": username, "document_id": document_id, "page": page["page"]},
+        {**page, "username": username, "document_id": document_id},
+        upsert=True,
+    )
+
+
+async def iter_pages(
+        username: str,
+        document_id: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        fields: Optional[List[str]] = None
+) -> AsyncIterator[dict]:
+    """
+    Stream the pages of a document in page order, optionally limited to the
+    inclusive range start..end and projected to `fields`.
+    """
+    query = {"username": username, "document_id": document_id}
+    page_range = {}
+    if start is not None:
+        page_range["$gte"] = start
+    if end is not None:
+        page_range["$lte"] = end
+    if page_range:
+        query["page"] = page_range
+    projection = {"_id": 0, "username": 0, "document_id": 0}
+    if fields:
+        projection = {"_id": 0, "page": 1, **{field: 1 for field in fields}}
+
+    found = False
+    async for page in page_collection.find(query, projection).sort("page", ASCENDING).batch_size(PAGE_BATCH_SIZE):
+        found = True
+        yield page
+    if found:
+        return
+
+    # Documents stored before pages had their own collection
+    header = await collection.find_one({"username": username, "document_id": document_id}, {"_id": 0, "pages": 1})
+    for page in (header or {}).get("pages", []):
+        if (start is None or page["page"] >= start) and (end is None or page["page"] <= end):
+            yield {key: value for key, value in page.items() if not fields or key == "page" or key in fields}
 
 
-def get_specific_documents(username: str, document_id: List[str]):
-    print("document_id argument:", document_id)
-    print("type of document_id:", type(document_id))
+async def get_pages(username: str, document_id: str, start: Optional[int] = None, end: Optional[int] = None):
+    return [page async for page in iter_pages(username, document_id, start, end)]
+
+
+async def clone_pages(source_username: str, source_document_id: str, username: str, document_id: str):
+    batch = []
+    async for page in iter_pages(source_username, source_document_id):
+        batch.append({**page, "username": username, "document_id": document_id})
+        if len(batch) == PAGE_BATCH_SIZE:
+            await page_collection.insert_many(batch)
+            batch = []
+    if batch:
+        await page_collection.insert_many(batch)
+
+
+async def _with_pages(headers: List[dict]) -> List[dict]:
+    for header in headers:
+        if "pages" not in header:
+            header["pages"] = await get_pages(header["username"], header["document_id"])
+    return headers
+
+
+async def get_specific_documents(username: str, document_id: List[str], include_pages: bool = True):
+    logger.debug("Fetching documents %s", document_id)
     ans = collection.find({"username": username, "document_id": {"$in": document_id}}, {'_id': 0})
 
-    return list(ans)
+    headers = await ans.to_list()
+    return await _with_pages(headers) if include_pages else headers
 
 
-def get_single_documents(username: str, document_id: str):
-    print("document_id argument:", document_id)
-    print("type of document_id:", type(document_id))
+async def get_single_documents(username: str, document_id: str, include_pages: bool = True):
+    logger.debug("Fetching document %s", document_id)
     ans = collection.find({"username": username, "document_id": document_id}, {'_id': 0})
 
-    return list(ans)
+    headers = await ans.to_list()
+    return await _with_pages(headers) if include_pages else headers
+
+
+async def get_all_documents(username: str, include_pages: bool = True):
+    headers = await collection.find({"username": username}, {'_id': 0}).to_list()
+    return await _with_pages(headers) if include_pages else headers
+
+
+async def iter_document_listing(
+        username: str,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None
+) -> AsyncIterator[dict]:
+    """
+    Stream document metadata (no page content) ordered by document_id.
+
+    Pass the last document_id seen as `cursor` to continue after it. Extra
+    header fields from LISTING_OPTIONAL_FIELDS can be requested in `fields`.
+    Served by the (username, document_id) index.
+    """
+    query = {"username": username}
+    if cursor is not None:
+        query["document_id"] = {"$gt": cursor}
+    pipeline = [{"$match": query}, {"$sort": {"document_id": ASCENDING}}]
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": {
+        "_id": 0,
+        "document_id": 1,
+        "filename": 1,
+        "size_bytes": 1,
+        "created_at": 1,
+        # Older documents have no page_count but embed their pages
+        "page_count": {"$ifNull": ["$page_count", {"$size": {"$ifNull": ["$pages", []]}}]},
+        **{field: 1 for field in fields or [] if field in LISTING_OPTIONAL_FIELDS},
+    }})
+
+    async for doc in await collection.aggregate(pipeline, batchSize=PAGE_BATCH_SIZE):
+        yield doc
+
+
+async def mongo_delete_document(username: str, document_id: str):
+    await page_collection.delete_many({"username": username, "document_id": document_id})
+    return await collection.delete_one({"username": username, "document_id": document_id})
+
+
+async def mark_indexed(username: str, document_id: str):
+    """Flag a document whose vectors are fully stored, making it reusable for deduplication."""
+    return await collection.update_one(
+        {"username": username, "document_id": document_id}, {"$set": {"indexed": True}}
+    )
+
+
+async def get_document_by_hash(content_hash: str, username: Optional[str] = None):
+    """
+    Find a fully indexed document with the given content hash, owned by
+    `username` when given, by anyone otherwise.
+    """
+    query = {"content_hash": content_hash, "indexed": True}
+    if username is not None:
+        query["username"] = username
+    return await collection.find_one(query, {'_id': 0})
+
+
+async def get_cached_themes(keys: List[str]) -> dict:
+    """Return {key: themes} for the theme extraction results already cached under `keys`."""
+    if not keys:
+        return {}
+    cursor = theme_collection.find({"_id": {"$in": keys}})
+    return {doc["_id"]: doc["themes"] async for doc in cursor}
+
+
+async def cache_themes(results: dict):
+    cached_at = datetime.now(timezone.utc)
+    await theme_collection.bulk_write(
+        [UpdateOne({"_id": key}, {"$set": {"themes": themes, "cached_at": cached_at}}, upsert=True)
+         for key, themes in results.items()],
+        ordered=False,
+    )
+
+
+async def get_corpus_generation(username: str) -> int:
+    doc = await corpus_collection.find_one({"_id": username})
+    return doc["generation"] if doc else 0
+
 
+async def bump_corpus_generation(username: str):
+    await corpus_collection.update_one({"_id": username}, {"$inc": {"generation": 1}}, upsert=True)
 
-def get_all_documents(username: str):
-    return collection.find({"username": username}, {'_id': 0})
 
+async def save_job(job: dict):
+    """Write the current status of an ingestion job."""
+    await job_collection.update_one(
+        {"_id": job["job_id"]}, {"$set": {**job, "saved_at": datetime.now(timezone.utc)}}, upsert=True
+    )
 
-def mongo_delete_document(username: str, document_id: str):
 
-    return collection.delete_one({"username": username, "document_id": document_id})
+async def get_job(job_id: str) -> Optional[dict]:
+    return await job_collection.find_one({"_id": job_id}, {"_id": 0, "saved_at": 0})
@@ -0,0 +1,4 @@
+from .collection import ensure_collection, PAYLOAD_INDEXES, SPARSE_VECTOR_NAME
+from .sparse import BM25SparseEmbeddings, tokenize
+from .search import search_points, RETRIEVAL_MODES
+from .writer import write_points, WriteProgress, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, UPSERT_CONCURRENCY
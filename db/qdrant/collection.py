@@ -0,0 +1,58 @@
+import logging
+import os
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams, KeywordIndexType, KeywordIndexParams, HnswConfigDiff, \
+    SparseVectorParams, Modifier
+
+logger = logging.getLogger(__name__)
+
+# Named sparse vector holding BM25 term weights, scored with Qdrant-side IDF
+SPARSE_VECTOR_NAME = "langchain-sparse"
+
+# Every search is filtered by tenant, so the global HNSW graph is disabled
+# (m=0) and a graph is built per tenant through the group_id index instead
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "0"))
+QDRANT_HNSW_PAYLOAD_M = int(os.getenv("QDRANT_HNSW_PAYLOAD_M", "16"))
+
+# Payload fields filtered on by queries and deletes, with their index params
+PAYLOAD_INDEXES = {
+    "metadata.group_id": KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+    "metadata.document_id": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+}
+
+
+def ensure_collection(qdrant: QdrantClient, name: str, vector_size: int = 384):
+    """
+    Create the collection or migrate an existing one to the multitenant
+    layout: tenant-keyed payload indexes and per-tenant HNSW graphs.
+
+    Only missing pieces are changed, so it is safe to run on every start.
+    Returns whether the collection has the BM25 sparse vector. Qdrant cannot
+    add vectors to an existing collection, so collections created before
+    hybrid search stay dense-only until they are rebuilt.
+    """
+    hnsw_config = HnswConfigDiff(m=QDRANT_HNSW_M, payload_m=QDRANT_HNSW_PAYLOAD_M)
+    if not qdrant.collection_exists(name):
+        qdrant.create_collection(
+            collection_name=name,
+            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+            sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)},
+            hnsw_config=hnsw_config,
+        )
+
+    info = qdrant.get_collection(name)
+    current = info.config.hnsw_config
+    if current.m != QDRANT_HNSW_M or current.payload_m != QDRANT_HNSW_PAYLOAD_M:
+        logger.info("Updating HNSW config of %s", name)
+        qdrant.update_collection(collection_name=name, hnsw_config=hnsw_config)
+
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in info.payload_schema:
+            logger.info("Creating payload index %s on %s", field_name, name)
+            qdrant.create_payload_index(collection_name=name, field_name=field_name, field_schema=field_schema)
+
+    has_sparse = SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+    if not has_sparse:
+        logger.warning("%s has no %s vector, hybrid search is disabled", name, SPARSE_VECTOR_NAME)
+    return has_sparse
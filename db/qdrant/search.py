@@ -0,0 +1,61 @@
+import os
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import SparseEmbeddings
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Filter, Prefetch, FusionQuery, Fusion, ScoredPoint, SparseVector
+
+from .collection import SPARSE_VECTOR_NAME
+
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+# Candidates taken from each of the dense and sparse searches before fusion.
+# Fusing two lists of only k results loses documents ranked well by one side.
+HYBRID_PREFETCH_LIMIT = int(os.getenv("HYBRID_PREFETCH_LIMIT", "40"))
+
+
+def search_points(
+        client: QdrantClient,
+        collection_name: str,
+        query: str,
+        query_filter: Filter,
+        dense: Embeddings,
+        sparse: SparseEmbeddings,
+        mode: str = "hybrid",
+        k: int = 5,
+) -> List[ScoredPoint]:
+    """
+    Search a collection in one of RETRIEVAL_MODES.
+
+    "hybrid" runs the dense and the BM25 sparse search in a single request
+    and merges them with reciprocal rank fusion on the Qdrant side.
+    """
+    if mode == "dense":
+        return client.query_points(
+            collection_name=collection_name, query=dense.embed_query(query),
+            query_filter=query_filter, limit=k, with_payload=True,
+        ).points
+
+    sparse_query = sparse.embed_query(query)
+    sparse_query = SparseVector(indices=sparse_query.indices, values=sparse_query.values)
+    if mode == "sparse":
+        return client.query_points(
+            collection_name=collection_name, query=sparse_query, using=SPARSE_VECTOR_NAME,
+            query_filter=query_filter, limit=k, with_payload=True,
+        ).points
+
+    if mode != "hybrid":
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+
+    prefetch_limit = max(HYBRID_PREFETCH_LIMIT, k)
+    return client.query_points(
+        collection_name=collection_name,
+        prefetch=[
+            Prefetch(query=dense.embed_query(query), filter=query_filter, limit=prefetch_limit),
+            Prefetch(query=sparse_query, using=SPARSE_VECTOR_NAME, filter=query_filter, limit=prefetch_limit),
+        ],
+        query=FusionQuery(fusion=Fusion.RRF),
+        limit=k,
+        with_payload=True,
+    ).points
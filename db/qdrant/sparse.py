@@ -0,0 +1,67 @@
+import os
+import re
+import zlib
+from collections import Counter
+from typing import List
+
+from langchain_qdrant import SparseEmbeddings, SparseVector
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Expected chunk length in tokens, used for BM25 length normalisation
+BM25_AVG_DOC_LEN = float(os.getenv("BM25_AVG_DOC_LEN", "120"))
+
+# Words, plus identifiers joined by - . / : such as case numbers ("2021-cv-00412")
+# or section references ("12.4.1"). Identifiers are indexed whole and by part.
+_TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        tokens.append(match)
+        if not match.isalnum():
+            tokens.extend(part for part in re.split(r"[-./:]", match) if part)
+    return tokens
+
+
+def _token_id(token: str) -> int:
+    return zlib.crc32(token.encode())
+
+
+class BM25SparseEmbeddings(SparseEmbeddings):
+    """
+    BM25 term weights as Qdrant sparse vectors, computed locally.
+
+    Documents carry the saturated, length-normalised term frequency. Queries
+    carry a weight of 1 per distinct term. The IDF factor is applied by
+    Qdrant at search time (the sparse vector is created with Modifier.IDF),
+    so it always reflects the current corpus.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B, avg_doc_len: float = BM25_AVG_DOC_LEN):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = avg_doc_len
+
+    def _sparse(self, weights: dict) -> SparseVector:
+        # Hash collisions between distinct tokens are merged, not duplicated
+        merged = Counter()
+        for token, weight in weights.items():
+            merged[_token_id(token)] += weight
+        indices = sorted(merged)
+        return SparseVector(indices=indices, values=[merged[index] for index in indices])
+
+    def embed_document(self, text: str) -> SparseVector:
+        counts = Counter(tokenize(text))
+        length_norm = self.k1 * (1 - self.b + self.b * sum(counts.values()) / self.avg_doc_len)
+        return self._sparse({
+            token: tf * (self.k1 + 1) / (tf + length_norm)
+            for token, tf in counts.items()
+        })
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self.embed_document(text) for text in texts]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self._sparse({token: 1.0 for token in tokenize(text)})
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import SparseEmbeddings
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, SparseVector
+
+from metrics import timed, CHUNKS
+from .collection import SPARSE_VECTOR_NAME
+
+logger = logging.getLogger(__name__)
+
+# Chunks per embedding request and upsert; 50 is the Cloudflare request batch
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "50"))
+# Batches being embedded at once, and upserts in flight to Qdrant
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "2"))
+# Attempts after the first for a failed batch, with exponential backoff
+INDEX_RETRIES = int(os.getenv("INDEX_RETRIES", "3"))
+INDEX_RETRY_BACKOFF = float(os.getenv("INDEX_RETRY_BACKOFF", "0.5"))
+
+# Called as progress(chunks_written, total_chunks) after every stored batch
+WriteProgress = Callable[[int, int], None]
+
+
+async def _with_retry(step: str, fn, *args, retries: int, stats: dict):
+    for attempt in range(retries + 1):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            stats["retries"] += 1
+            logger.warning("%s failed (%s), retrying", step, e)
+            await asyncio.sleep(INDEX_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def write_points(
+        client: QdrantClient,
+        collection_name: str,
+        documents: List[Document],
+        dense: Embeddings,
+        sparse: Optional[SparseEmbeddings] = None,
+        ids: Optional[List[str]] = None,
+        batch_size: int = EMBED_BATCH_SIZE,
+        embed_concurrency: int = EMBED_CONCURRENCY,
+        upsert_concurrency: int = UPSERT_CONCURRENCY,
+        retries: int = INDEX_RETRIES,
+        progress: Optional[WriteProgress] = None,
+) -> dict:
+    """
+    Embed and store documents in batches, in the payload layout of
+    QdrantVectorStore.
+
+    Up to `embed_concurrency` batches are embedded while earlier ones are
+    being upserted, so embedding and Qdrant writes overlap. A failing batch
+    is retried on its own. If it still fails, the other batches are written
+    anyway and the failure is counted in the returned report.
+    """
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    batches = [
+        (documents[start:start + batch_size], ids[start:start + batch_size])
+        for start in range(0, len(documents), batch_size)
+    ]
+    stats = {"chunks": len(documents), "chunks_written": 0, "chunks_failed": 0, "batches": len(batches),
+             "batches_failed": 0, "retries": 0}
+    # Embedded batches waiting for an upsert slot; bounds the vectors held in memory
+    ready = asyncio.Queue(maxsize=upsert_concurrency)
+    embed_semaphore = asyncio.Semaphore(embed_concurrency)
+
+    def embed(batch: List[Document], batch_ids: List[str]) -> List[PointStruct]:
+        texts = [document.page_content for document in batch]
+        with timed("embed"):
+            dense_vectors = dense.embed_documents(texts)
+            if sparse is None:
+                vectors = dense_vectors
+            else:
+                vectors = [
+                    {"": dense_vector, SPARSE_VECTOR_NAME: SparseVector(indices=s.indices, values=s.values)}
+                    for dense_vector, s in zip(dense_vectors, sparse.embed_documents(texts))
+                ]
+        return [
+            PointStruct(id=point_id, vector=vector,
+                        payload={"page_content": document.page_content, "metadata": document.metadata})
+            for point_id, vector, document in zip(batch_ids, vectors, batch)
+        ]
+
+    def upsert(points: List[PointStruct]):
+        with timed("qdrant_upsert"):
+            client.upsert(collection_name=collection_name, points=points, wait=True)
+
+    def failed(batch: List[Document], step: str, error: Exception):
+        logger.error("%s of a %d chunk batch failed for good: %s", step, len(batch), error)
+        CHUNKS.labels(outcome="failed").inc(len(batch))
+        stats["chunks_failed"] += len(batch)
+        stats["batches_failed"] += 1
+
+    async def produce(batch: List[Document], batch_ids: List[str]):
+        async with embed_semaphore:
+            try:
+                points = await _with_retry("Embedding", embed, batch, batch_ids, retries=retries, stats=stats)
+            except Exception as e:
+                failed(batch, "Embedding", e)
+                return
+            await ready.put(points)
+
+    async def consume():
+        while (points := await ready.get()) is not None:
+            try:
+                await _with_retry("Upsert", upsert, points, retries=retries, stats=stats)
+                stats["chunks_written"] += len(points)
+                CHUNKS.labels(outcome="written").inc(len(points))
+                if progress:
+                    progress(stats["chunks_written"], stats["chunks"])
+            except Exception as e:
+                failed(points, "Upsert", e)
+
+    start = time.perf_counter()
+    consumers = [asyncio.create_task(consume()) for _ in range(upsert_concurrency)]
+    producers = [asyncio.create_task(produce(batch, batch_ids)) for batch, batch_ids in batches]
+    try:
+        await asyncio.gather(*producers)
+        for _ in consumers:
+            await ready.put(None)
+        await asyncio.gather(*consumers)
+    except BaseException:
+        for task in producers + consumers:
+            task.cancel()
+        raise
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["chunks_per_second"] = stats["chunks_written"] / stats["seconds"] if stats["seconds"] else 0.0
+    logger.info("Indexed %d/%d chunks in %d batches, %.2fs (%.1f chunks/s), %d retries, %d failed",
+                stats["chunks_written"], stats["chunks"], stats["batches"], stats["seconds"],
+                stats["chunks_per_second"], stats["retries"], stats["chunks_failed"])
+    return stats
@@ -1 +1 @@
-from .supadb import get_user, insert_user
+from .supadb import get_user, insert_user, update_password_hash
@@ -1,16 +1,24 @@
-from supabase import create_client, Client
+import logging
+
+from backends import create_user_store, registry
 from schema import UserInDB
-import os
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+logger = logging.getLogger(__name__)
+
+
+def _check(store):
+    store.table("users").select("username").limit(1).execute()
+
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+registry.register("supabase", create_user_store, check=_check)
+
+supabase = registry.lazy("supabase")
 
 
 def get_user(username: str) -> UserInDB | None:
     response = supabase.table("users").select("*").eq("username", username).limit(1).execute()
-    print(response.data)
+    # Never log the rows themselves, they hold the password hash
+    logger.debug("User lookup for %s found %d rows", username, len(response.data))
     if response.data:
         return UserInDB(**response.data[0])
     return None
@@ -23,3 +31,9 @@ def insert_user(user: UserInDB, hashed_password: str):
     }).execute()
 
     return result
+
+
+def update_password_hash(username: str, hashed_password: str):
+    return supabase.table("users").update({
+        "hashed_password": hashed_password,
+    }).eq("username", username).execute()
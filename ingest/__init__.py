@@ -0,0 +1,5 @@
+from .jobs import ingest_queue, QueueFullError, INGEST_WORKERS, INGEST_QUEUE_SIZE
+from .pipeline import ingest_file, SUPPORTED_EXTENSIONS
+from .spool import spool_upload, UploadTooLargeError, UploadSizeLimitMiddleware, MAX_UPLOAD_BYTES, \
+    MAX_UPLOAD_REQUEST_BYTES
+from .dedup import reuse_existing_document
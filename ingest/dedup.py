@@ -0,0 +1,66 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from chat import clone_document_vectors, delete_document_from_vectorstore
+from db.mongo import clone_pages, get_document_by_hash, insert_into, mark_indexed, mongo_delete_document
+
+logger = logging.getLogger(__name__)
+
+
+async def _discard_clone(username: str, document_id: str):
+    """Remove the header, pages and vectors copied so far for a clone that failed."""
+    try:
+        await mongo_delete_document(username, document_id)
+        await delete_document_from_vectorstore(document_id, username)
+    except Exception:
+        logger.exception("Removing partly cloned document %s failed", document_id)
+
+
+async def reuse_existing_document(content_hash: str, username: str, filename: str) -> Optional[dict]:
+    """
+    Return an already ingested document with the same content instead of
+    processing the upload again.
+
+    The user's own copy is returned as is. A copy owned by another user is
+    cloned for this user: the Mongo record and the stored vectors are copied
+    under a new document id, nothing is OCR'd, refined or embedded. Whether
+    the content came from another user is not part of the result.
+    Returns None when the content has not been seen before.
+    """
+    existing = await get_document_by_hash(content_hash, username)
+    if existing is not None:
+        return {"filename": filename, "document_id": existing["document_id"]}
+
+    existing = await get_document_by_hash(content_hash)
+    if existing is None:
+        return None
+
+    document_id = str(uuid.uuid4())
+    cloned = {
+        **existing,
+        "username": username,
+        "document_id": document_id,
+        "filename": filename,
+        "indexed": False,
+        # The copy is this user's ingest, not the source tenant's
+        "created_at": datetime.now(timezone.utc),
+    }
+    cloned.pop("pages", None)
+    try:
+        await insert_into(cloned)
+        await clone_pages(existing["username"], existing["document_id"], username, document_id)
+        await clone_document_vectors(
+            existing["username"],
+            existing["document_id"],
+            username,
+            document_id,
+            filename,
+        )
+        await mark_indexed(username, document_id)
+    except BaseException:
+        await _discard_clone(username, document_id)
+        raise
+    logger.info("Cloned document %s of another user as %s", existing["document_id"], document_id)
+    return {"filename": filename, "document_id": document_id}
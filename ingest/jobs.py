@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from db.mongo import get_job, save_job
+from schema import JobStatus
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# 0 leaves the queue unbounded
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+JobRunner = Callable[[JobStatus], Awaitable[None]]
+# Releases what a job holds (its spooled upload) when it is dropped without running
+JobDiscard = Callable[[], None]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Bounded in-process queue of ingestion jobs drained by a fixed number of workers.
+
+    Every status change is written to Mongo, so any server worker can report
+    a job, not only the one running it. The worker running a job also keeps
+    it in memory; once more than `history` jobs are tracked there the oldest
+    finished ones are forgotten.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, maxsize: int = INGEST_QUEUE_SIZE,
+                 history: int = INGEST_JOB_HISTORY):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.history = history
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._jobs: "OrderedDict[str, JobStatus]" = OrderedDict()
+        # Jobs changed since their last write, and the write task of each job being saved
+        self._unsaved: Set[str] = set()
+        self._saving: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs still waiting will never run, release their uploads
+        while not self._queue.empty():
+            job, _, discard = self._queue.get_nowait()
+            self.update(job, status="failed", error="Server shut down before the job started")
+            if discard:
+                try:
+                    discard()
+                except Exception:
+                    logger.exception("Releasing job %s (%s) failed", job.job_id, job.filename)
+        await asyncio.gather(*self._saving.values(), return_exceptions=True)
+
+    def free_slots(self) -> int:
+        if self.maxsize <= 0:
+            return sys.maxsize
+        return self.maxsize - self._queue.qsize()
+
+    def submit(self, username: str, filename: str, runner: JobRunner,
+               discard: Optional[JobDiscard] = None) -> JobStatus:
+        now = time.time()
+        job = JobStatus(
+            job_id=str(uuid.uuid4()),
+            username=username,
+            filename=filename,
+            created_at=now,
+            updated_at=now,
+        )
+        try:
+            self._queue.put_nowait((job, runner, discard))
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full")
+
+        self._jobs[job.job_id] = job
+        self._save(job)
+        self._prune()
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # Accepted by another worker, or forgotten here
+        saved = await get_job(job_id)
+        return JobStatus(**saved) if saved else None
+
+    def update(self, job: JobStatus, **fields):
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+        self._save(job)
+
+    def _save(self, job: JobStatus):
+        """
+        Write the job to Mongo in the background. Updates made while a write
+        is in flight (page progress comes in bursts) are folded into one
+        more write of the latest state.
+        """
+        self._unsaved.add(job.job_id)
+        if job.job_id not in self._saving:
+            self._saving[job.job_id] = asyncio.create_task(self._write(job))
+
+    async def _write(self, job: JobStatus):
+        try:
+            while job.job_id in self._unsaved:
+                self._unsaved.discard(job.job_id)
+                try:
+                    await save_job(job.model_dump())
+                except Exception:
+                    logger.exception("Saving the status of job %s failed", job.job_id)
+        finally:
+            del self._saving[job.job_id]
+
+    def _prune(self):
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job, runner, _ = await self._queue.get()
+            self.update(job, status="processing")
+            try:
+                await runner(job)
+                self.update(job, status="done", stage=None)
+            except asyncio.CancelledError:
+                self.update(job, status="failed", error="Server shut down while the job was running")
+                raise
+            except Exception as e:
+                logger.exception("Ingestion job %s (%s) failed", job.job_id, job.filename)
+                self.update(job, status="failed", error=str(e))
+            finally:
+                self._queue.task_done()
+
+
+ingest_queue = JobQueue()
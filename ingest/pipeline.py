@@ -0,0 +1,61 @@
+import os
+from typing import Optional
+
+from schema import DocumentModel, JobStatus
+from chat import do_processing, process_image_file, insert_into_vectorstore
+from db.mongo import mark_indexed
+from .jobs import ingest_queue
+
+PDF_EXTENSIONS = (".pdf",)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SUPPORTED_EXTENSIONS = PDF_EXTENSIONS + IMAGE_EXTENSIONS
+
+
+async def ingest_file(job: JobStatus, path: str, content_hash: Optional[str] = None):
+    """
+    Run the full ingestion pipeline for one spooled upload:
+    OCR + refinement, Mongo insert and vector store insertion.
+    """
+
+    def progress(pages_done: int, total_pages: int):
+        ingest_queue.update(job, pages_done=pages_done, total_pages=total_pages)
+
+    def on_document(document_id: str):
+        # Known to the job before processing ends, so a stuck document can be found
+        ingest_queue.update(job, document_id=document_id)
+
+    try:
+        ingest_queue.update(job, stage="processing")
+        if job.filename.lower().endswith(PDF_EXTENSIONS):
+            doc = await do_processing(path, job.filename, username=job.username, progress=progress,
+                                      content_hash=content_hash, on_document=on_document)
+        else:
+            doc = await process_image_file(path, job.filename, username=job.username, progress=progress,
+                                           content_hash=content_hash, on_document=on_document)
+        ingest_queue.update(
+            job,
+            document_id=doc["document_id"],
+            pages_refined=doc["pages_refined"],
+            pages_skipped=doc["pages_skipped"],
+            stage="indexing",
+        )
+
+        def index_progress(chunks_indexed: int, chunks_total: int):
+            ingest_queue.update(job, chunks_indexed=chunks_indexed, chunks_total=chunks_total)
+
+        document = DocumentModel(**doc["document"])
+        report = await insert_into_vectorstore([document], job.username, progress=index_progress)
+        ingest_queue.update(
+            job,
+            chunks_total=report["chunks"],
+            chunks_indexed=report["chunks_written"],
+            chunks_failed=report["chunks_failed"],
+            chunks_per_second=report["chunks_per_second"],
+        )
+        if report["chunks_failed"]:
+            # The stored chunks stay searchable, but a partly indexed
+            # document must not be reused by deduplication
+            raise RuntimeError(f"{report['chunks_failed']} of {report['chunks']} chunks could not be indexed")
+        await mark_indexed(job.username, doc["document_id"])
+    finally:
+        os.remove(path)
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tempfile
+from typing import Iterable, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# Largest accepted file, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Largest accepted upload request body, all files of the request together
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+SPOOL_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, str]:
+    """
+    Stream an upload to a temp file that outlives the request, hashing it on the way.
+
+    Only one chunk is held in memory at a time. Returns the temp file path and
+    the SHA-256 hex digest of the content. Raises UploadTooLargeError (and
+    removes the partial file) once more than `max_bytes` have been read.
+    The caller owns the returned path and must remove it once processed.
+    """
+    suffix = os.path.splitext(file.filename)[1].lower()
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_SPOOL_DIR) as tmp:
+        try:
+            while chunk := file.file.read(SPOOL_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    return tmp.name, digest.hexdigest()
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject upload requests whose body is over `max_bytes` before it is parsed.
+
+    Starlette writes the whole multipart body to its own temp files before
+    the endpoint runs, so the per-file limit of spool_upload only applies
+    once an oversized body was fully received. A declared Content-Length over
+    the limit is answered with 413 right away; a body sent without one is
+    counted as it arrives and cut off with 413 once it passes the limit.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload larger than {self.max_bytes} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside form parsing, FastAPI passes HTTPExceptions on as they are
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
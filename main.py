@@ -1,45 +1,95 @@
+import asyncio
+import json
+import logging
 import os
+from contextlib import asynccontextmanager
 from datetime import timedelta
+from functools import partial
 from typing import Annotated, List
-from fastapi import FastAPI, UploadFile, Depends, HTTPException, status, Form
+from fastapi import FastAPI, UploadFile, Depends, HTTPException, status, Form, Query
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
 
 from db.mongo import (
+    get_pages,
+    get_single_documents,
     get_specific_documents,
-    get_all_documents,
+    iter_document_listing,
+    mark_indexed,
     mongo_delete_document
 )
 from chat import (
-    do_processing,
-    insert_into_vectorstore,
-    refine_query,
+    arefine_query,
     rag,
+    arag_stream,
+    build_context,
     query_documents,
-    process_image_file,
     delete_document_from_vectorstore,
-    find_themes
+    reindex_document,
+    find_themes,
+    embeddings,
+    query_cache
 )
+from ingest import (
+    ingest_queue,
+    ingest_file,
+    spool_upload,
+    reuse_existing_document,
+    UploadTooLargeError,
+    UploadSizeLimitMiddleware,
+    QueueFullError,
+    SUPPORTED_EXTENSIONS
+)
+from backends import registry
+from metrics import render_metrics, TOKENS
+from ocr import shutdown_ocr_pool
 from schema import (
     UserRegister,
     User,
     DocumentModel,
     QueryRequest,
     DocumentIDsRequest,
-    Token
+    Token,
+    JobStatus
 )
 from auth import authenticate_user
 from auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     register_user,
-    get_current_user
+    get_current_user,
+    user_cache,
+    HashingOverloadedError,
+    shutdown_password_executor
+)
+
+# DEBUG adds per-stage timings and lookups; calls below the level are skipped
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
 )
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients connect lazily; warmup (indexes, collection layout) runs in the background
+    registry.start()
+    await ingest_queue.start()
+    yield
+    await ingest_queue.stop()
+    shutdown_ocr_pool()
+    shutdown_password_executor()
+    await registry.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+MAX_LISTING_LIMIT = 500
 
 
 class FormData(BaseModel):
@@ -57,6 +107,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Oversized uploads are refused before the multipart body is parsed and spooled
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/uploadfiles/"])
 
 
 @app.get("/")
@@ -64,13 +116,67 @@ async def root():
     return {"message": "Hello World"}
 
 
-@app.post("/uploadfiles/")
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: checks every backend (Mongo, Qdrant, embeddings, user store).
+
+    Returns:
+        JSONResponse: 200 when all backends answer, 503 otherwise, with the
+        status of each backend and how long the startup warmup took
+    """
+    backends = await registry.readiness()
+    is_ready = all(backend["ok"] for backend in backends.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "ready": is_ready,
+            "backends": backends,
+            "warmup_seconds": registry.warmup_seconds,
+            "warmup_errors": registry.warmup_errors,
+        },
+    )
+
+
+@app.get("/stats")
+async def cache_stats():
+    """
+    Report cache effectiveness.
+
+    Returns:
+        dict: Hit/miss counts, hit rate and storage used per cache
+    """
+    return {
+        "embedding_cache": await asyncio.to_thread(embeddings.stats),
+        "query_cache": query_cache.stats(),
+        "user_cache": user_cache.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms and page, chunk and token counters.
+
+    Returns:
+        Response: Metrics in the Prometheus text exposition format
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.post("/uploadfiles/", status_code=202)
 async def create_upload_files(
     files: list[UploadFile],
     current_user: Annotated[User, Depends(get_current_user)]
 ):
     """
-    Process and store multiple uploaded files in the vector database.
+    Queue multiple uploaded files for background processing.
+
+    Each file becomes an ingestion job that is OCR'd, refined and stored in
+    the vector database by the ingestion workers. Poll `GET /jobs/{job_id}`
+    for progress. Files whose content was already ingested are not queued,
+    the existing document (or a copy of another user's) is returned instead.
 
     Supported formats:
     - PDF documents (processed with text extraction)
@@ -81,40 +187,103 @@ async def create_upload_files(
         current_user: Authenticated user object from JWT
 
     Returns:
-        dict: List of successfully processed filenames
+        dict: Filenames, queued jobs and deduplicated documents
 
     Raises:
         HTTPException:
             400 - Unsupported file type
-            500 - Vector store insertion error
+            413 - File larger than MAX_UPLOAD_BYTES, or request larger than MAX_UPLOAD_REQUEST_BYTES
+            503 - Ingestion queue is full
     """
-    parsed_documents = []
-    uploaded_filenames = []
-
     for file in files:
-        filename = file.filename.lower()
+        if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
 
-        try:
-            if filename.endswith(".pdf"):
-                doc = await do_processing(file, username=current_user.username)
-            elif filename.endswith((".jpg", ".jpeg", ".png")):
-                doc = await process_image_file(file, username=current_user.username)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
+    if ingest_queue.free_slots() < len(files):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingestion queue is full, retry later",
+            headers={"Retry-After": "30"},
+        )
 
-            parsed_documents.append(DocumentModel(**doc["document"]))
-            uploaded_filenames.append(doc["filename"])
+    # Spool every file before queueing any, so a rejected file leaves nothing behind
+    spooled = []
+    try:
+        for file in files:
+            spooled.append((file, *await asyncio.to_thread(spool_upload, file)))
+    except UploadTooLargeError as e:
+        for _, path, _ in spooled:
+            os.remove(path)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+    jobs = []
+    deduplicated = []
+    # Spooled files not handed to a job yet, removed however the request ends
+    remaining = list(spooled)
+    try:
+        while remaining:
+            file, path, content_hash = remaining[0]
+            try:
+                existing = await reuse_existing_document(content_hash, current_user.username, file.filename)
+            except Exception:
+                # Deduplication only saves work, the file is ingested from scratch instead
+                logger.exception("Deduplicating %s failed, ingesting it", file.filename)
+                existing = None
+            if existing is not None:
+                remaining.pop(0)
+                os.remove(path)
+                deduplicated.append(existing)
+                continue
+
+            try:
+                job = ingest_queue.submit(
+                    current_user.username,
+                    file.filename,
+                    partial(ingest_file, path=path, content_hash=content_hash),
+                    discard=partial(os.remove, path),
+                )
+            except QueueFullError:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Ingestion queue is full, retry later",
+                    headers={"Retry-After": "30"},
+                )
+            remaining.pop(0)
+            jobs.append({"job_id": job.job_id, "filename": job.filename})
+    finally:
+        for _, path, _ in remaining:
+            os.remove(path)
+
+    return {
+        "filenames": [file.filename for file in files],
+        "jobs": jobs,
+        "deduplicated": deduplicated
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: Annotated[User, Depends(get_current_user)]
+) -> JobStatus:
+    """
+    Report the status and per-page progress of an ingestion job.
 
-        except Exception as e:
-            print(f"Failed to process {filename}: {e}")
-            continue
+    Args:
+        job_id: Id returned by /uploadfiles/
+        current_user: Authenticated user
 
-    try:
-        insert_into_vectorstore(parsed_documents, current_user.username)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error inserting into vector store: {e}")
+    Returns:
+        JobStatus: Current state of the job
 
-    return {"filenames": uploaded_filenames}
+    Raises:
+        HTTPException:
+            404 - Unknown job or job owned by another user
+    """
+    job = await ingest_queue.get(job_id)
+    if job is None or job.username != current_user.username:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.post("/login")
@@ -126,6 +295,7 @@ async def login_for_access_token(
 
        Uses OAuth2 password flow for standard authentication.
        Token expires after 30 minutes by default (configurable).
+       Password checks run on a dedicated bounded executor, off the event loop.
 
        Args:
            form_data: Standard OAuth2 form containing username/password
@@ -136,8 +306,16 @@ async def login_for_access_token(
        Raises:
            HTTPException:
                401 - Invalid credentials
+               503 - Too many logins in progress
        """
-    user = authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except HashingOverloadedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, retry later",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -146,13 +324,13 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "email": user.email}, expires_delta=access_token_expires
     )
     return Token(access_token=access_token, token_type="bearer")
 
 
 @app.post("/register/", status_code=201)
-def register(user: Annotated[UserRegister, Form()]):
+async def register(user: Annotated[UserRegister, Form()]):
     """
       Register a new user account.
 
@@ -168,9 +346,16 @@ def register(user: Annotated[UserRegister, Form()]):
       Raises:
           HTTPException:
               500 - Registration failed (username taken, etc.)
+              503 - Too many registrations in progress
       """
     try:
-        return register_user(user)
+        return await register_user(user)
+    except HashingOverloadedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many registrations in progress, retry later",
+            headers={"Retry-After": "1"},
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Registration failed: {e}")
 
@@ -196,37 +381,104 @@ async def add_documents(
         """
     try:
         username = current_user.username
-        documents = get_specific_documents(username, document_ids)
+        documents = await get_specific_documents(username, document_ids)
         return documents
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving documents: {e}")
 
 
-@app.get("/vectorstore/get_documents")
-def get_documents(current_user: Annotated[User, Depends(get_current_user)]):
-    try:
+@app.get("/vectorstore/documents/{document_id}/pages")
+async def get_document_pages(
+    document_id: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    start: int | None = None,
+    end: int | None = None
+):
+    """
+        Retrieve a range of pages of one document.
+
+        Args:
+            document_id: Document to read
+            current_user: Authenticated user
+            start: First page to return (1-based, inclusive)
+            end: Last page to return (inclusive)
+
+        Returns:
+            dict: { "pages": list of page objects in page order }
+
+        Raises:
+            HTTPException:
+                500 - Database retrieval error
         """
-          Retrieve all documents belonging to the authenticated user.
+    try:
+        pages = await get_pages(current_user.username, document_id, start, end)
+        return {"pages": pages}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving pages: {e}")
 
-          Args:
-              current_user: Authenticated user
 
-          Returns:
-              dict: { "documents": list of all user's documents }
+@app.get("/vectorstore/get_documents")
+async def get_documents(
+    current_user: Annotated[User, Depends(get_current_user)],
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=MAX_LISTING_LIMIT),
+    fields: str | None = None,
+    format: str = Query(default="json", pattern="^(json|ndjson)$")
+):
+    """
+      List the documents of the authenticated user, metadata only.
 
-          Raises:
-              HTTPException: 
-                  500 - Database error
-          """
-        username = current_user.username
-        documents = list(get_all_documents(username))
-        return {"documents": documents}
+      Each entry has document_id, filename, page_count, size_bytes and
+      created_at. Results are ordered by document_id and paginated with a
+      cursor. With format=ndjson every remaining document after the cursor
+      is streamed as one JSON object per line and `limit` is ignored.
+
+      Args:
+          current_user: Authenticated user
+          cursor: `next_cursor` of the previous page
+          limit: Max documents per page
+          fields: Comma separated extra fields: content_hash, status,
+              indexed, pages_refined, pages_skipped, or pages for the full
+              page content
+          format: json (paginated) or ndjson (streamed)
+
+      Returns:
+          dict: { "documents": list of documents, "next_cursor": str | None }
+          or an application/x-ndjson stream
+
+      Raises:
+          HTTPException:
+              500 - Database error
+      """
+    username = current_user.username
+    requested = [field.strip() for field in fields.split(",")] if fields else []
+    include_pages = "pages" in requested
+
+    async def with_pages(doc: dict) -> dict:
+        if include_pages:
+            doc["pages"] = await get_pages(username, doc["document_id"])
+        return doc
+
+    if format == "ndjson":
+        async def lines():
+            async for doc in iter_document_listing(username, cursor=cursor, fields=requested):
+                yield json.dumps(jsonable_encoder(await with_pages(doc))) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        documents = [
+            await with_pages(doc)
+            async for doc in iter_document_listing(username, cursor=cursor, limit=limit, fields=requested)
+        ]
+        next_cursor = documents[-1]["document_id"] if len(documents) == limit else None
+        return {"documents": documents, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get documents: {e}")
 
 
 @app.post("/query")
-def query_vectorstore(
+async def query_vectorstore(
     body: QueryRequest,
     current_user: Annotated[User, Depends(get_current_user)],
 ):
@@ -236,16 +488,22 @@ def query_vectorstore(
       Process flow:
       1. Refines the raw query for better search
       2. Retrieves relevant documents (either all or filtered by IDs)
-      3. Generates response using the RAG model
+      3. Packs the retrieved chunks into a token-budgeted context with citation tags
+      4. Generates response using the RAG model
+
+      Responses are cached per user, query and document scope until the
+      user's documents change.
 
       Args:
-          body: Contains query text and optional document IDs filter
+          body: Contains query text, optional document IDs filter and retrieval mode
           current_user: Authenticated user
 
       Returns:
           dict: {
               "documents": list of relevant documents,
-              "response": generated answer
+              "response": generated answer,
+              "context_tokens": tokens of retrieved text sent to the model,
+              "citations": source of each [n] tag in the context
           }
 
       Raises:
@@ -254,26 +512,104 @@ def query_vectorstore(
       """
     try:
         username = current_user.username
-        refined_query = refine_query(body.query)
+        cache_key = await query_cache.key(username, body.query, body.document_ids, mode=body.mode)
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        if body.document_ids is None:
-            documents = query_documents(refined_query.content, username)
-        else:
-            documents = query_documents(refined_query.content, username, document_ids=body.document_ids)
+        refined_query = await arefine_query(body.query)
 
-        response = rag(refined_query.content, documents)
+        documents = await asyncio.to_thread(
+            query_documents, refined_query.content, username, document_ids=body.document_ids, mode=body.mode
+        )
+
+        context = build_context(documents)
+        TOKENS.labels(kind="context").inc(context["tokens"])
+        response = await asyncio.to_thread(rag, refined_query.content, context["text"])
 
-        return {
+        result = {
             "documents": documents,
-            "response": response.content
+            "response": response.content,
+            "context_tokens": context["tokens"],
+            "citations": context["citations"]
         }
+        query_cache.set(cache_key, result)
+        return result
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def stream_query_vectorstore(
+    body: QueryRequest,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """
+      Query documents using RAG and stream the answer as Server-Sent Events.
+
+      Events, in order:
+      - documents: the retrieved documents, sent as soon as retrieval is done
+      - token: {"token": str} for every chunk of the answer as it is generated
+      - done: {"response": str, "context_tokens": int, "citations": list} with the full answer
+      - error: {"detail": str} if the query fails midway
+
+      Args:
+          body: Contains query text, optional document IDs filter and retrieval mode
+          current_user: Authenticated user
+
+      Returns:
+          StreamingResponse: text/event-stream of the events above
+      """
+    username = current_user.username
+    cache_key = await query_cache.key(username, body.query, body.document_ids, mode=body.mode)
+
+    async def events():
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            yield _sse("documents", cached["documents"])
+            yield _sse("token", {"token": cached["response"]})
+            yield _sse("done", {key: cached[key] for key in ("response", "context_tokens", "citations")})
+            return
+
+        try:
+            refined_query = await arefine_query(body.query)
+            documents = await asyncio.to_thread(
+                query_documents, refined_query.content, username, document_ids=body.document_ids, mode=body.mode
+            )
+            yield _sse("documents", documents)
+
+            context = build_context(documents)
+            TOKENS.labels(kind="context").inc(context["tokens"])
+            tokens = []
+            async for token in arag_stream(refined_query.content, context["text"]):
+                tokens.append(token)
+                yield _sse("token", {"token": token})
+
+            result = {
+                "documents": documents,
+                "response": "".join(tokens),
+                "context_tokens": context["tokens"],
+                "citations": context["citations"]
+            }
+            query_cache.set(cache_key, result)
+            yield _sse("done", {key: result[key] for key in ("response", "context_tokens", "citations")})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Query failed: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.delete("/vectorstore/delete_document")
-def delete_document(
+async def delete_document(
     document_id: str,
     current_user: Annotated[User, Depends(get_current_user)]
 ):
@@ -293,22 +629,66 @@ def delete_document(
     """
     try:
         username = current_user.username
-        delete_document_from_vectorstore(document_id, username)
-        mongo_delete_document(username, document_id)
+        await delete_document_from_vectorstore(document_id, username)
+        await mongo_delete_document(username, document_id)
         return {"status": "Document deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Deletion failed: {e}")
 
 
+@app.post("/vectorstore/documents/{document_id}/reindex")
+async def reindex(
+    document_id: str,
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    """
+    Re-index one document from its stored pages.
+
+    Only chunks whose text changed are embedded again; new chunks are added
+    and chunks that no longer exist are removed. Running it on an unchanged
+    document writes nothing.
+
+    Args:
+        document_id: Document to re-index
+        current_user: Authenticated user
+
+    Returns:
+        dict: {
+            "document_id", "chunks": chunks in the document,
+            "added", "updated", "removed", "unchanged", "failed": chunk counts
+        }
+
+    Raises:
+        HTTPException:
+            404 - Document not found
+            500 - Re-indexing failed
+    """
+    username = current_user.username
+    documents = await get_single_documents(username, document_id)
+    if not documents:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        report = await reindex_document(DocumentModel(**documents[0]), username)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Re-indexing failed: {e}")
+
+    if not report["failed"]:
+        await mark_indexed(username, document_id)
+    return report
+
+
 @app.post("/get_themes")
-def create_themes(
+async def create_themes(
     current_user: Annotated[User, Depends(get_current_user)],
     request: DocumentIDsRequest
 ):
     """
        Extract key themes from specified documents.
 
-       Uses NLP processing to identify common themes/topics.
+       Uses NLP processing to identify common themes/topics. Page and
+       document level results are cached, so repeated or overlapping
+       requests only analyse new content.
 
        Args:
            current_user: Authenticated user
@@ -323,7 +703,7 @@ def create_themes(
        """
     try:
         username = current_user.username
-        themes = find_themes(request.document_ids, username)
+        themes = await find_themes(request.document_ids, username)
         return {"themes": themes}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Theme extraction failed: {e}")
@@ -0,0 +1,11 @@
+from .stages import (
+    timed,
+    observe,
+    observe_stages,
+    count_llm_tokens,
+    render_metrics,
+    STAGE_SECONDS,
+    PAGES,
+    CHUNKS,
+    TOKENS
+)
@@ -0,0 +1,66 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages timed by STAGE_SECONDS:
+#   render, ocr, text_layer          - page extraction, measured inside the OCR workers
+#   refine_llm, mongo_insert         - per page cleanup and storage
+#   embed, qdrant_upsert             - per indexing batch
+#   refine_query, retrieval, rag     - per query
+#   theme_map, theme_reduce          - per theme extraction LLM call
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of one pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PAGES = Counter("rag_pages", "Pages ingested", ["extraction", "refined"])
+CHUNKS = Counter("rag_chunks", "Chunks sent to the vector store", ["outcome"])
+# chunked: tokens of the chunks cut from pages, context: retrieved text packed into RAG
+# prompts, llm_input/llm_output: as reported by the LLM
+TOKENS = Counter("rag_tokens", "Tokens processed", ["kind"])
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    logger.debug("%s took %.3fs", stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as one `stage` observation, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def observe_stages(timings: Dict[str, float]):
+    """Record {stage: seconds} measured in another process, e.g. an OCR worker."""
+    for stage, seconds in timings.items():
+        observe(stage, seconds)
+
+
+def count_llm_tokens(message):
+    """Add the token usage of an LLM response, when the model reports it."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        TOKENS.labels(kind="llm_input").inc(usage.get("input_tokens", 0))
+        TOKENS.labels(kind="llm_output").inc(usage.get("output_tokens", 0))
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus exposition of all metrics, merged across workers in multiprocess mode."""
+    # prometheus_client switches to multiprocess mode when the variable exists, even empty
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ or "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,12 @@
+from .engine import (
+    iter_pdf_pages,
+    ocr_image_file,
+    ocr_pdf_page,
+    extract_pdf_page,
+    text_quality,
+    pdf_page_count,
+    get_ocr_pool,
+    shutdown_ocr_pool,
+    OCR_WORKERS,
+    OCR_MAX_IN_FLIGHT
+)
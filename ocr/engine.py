@@ -0,0 +1,254 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Optional, Tuple
+
+import pymupdf
+import pytesseract
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or os.cpu_count() or 1)
+# Max pages submitted to the pool but not yet consumed, bounds memory per document
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT") or OCR_WORKERS * 2)
+
+# Born-digital pages use the PDF text layer, OCR only runs when it looks unusable
+PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "true").lower() == "true"
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "50"))
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("TEXT_LAYER_MIN_QUALITY", "0.8"))
+TEXT_LAYER_MAX_IMAGE_COVERAGE = float(os.getenv("TEXT_LAYER_MAX_IMAGE_COVERAGE", "0.8"))
+
+_WORD_RE = re.compile(r"^[\w.,;:!?'\"()\[\]{}\-/%$&@#*+=<>–—‘’“”]+$")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Documents opened inside a worker process, so consecutive pages of the same
+# file do not re-parse the PDF
+_open_documents: "OrderedDict[str, pymupdf.Document]" = OrderedDict()
+_MAX_OPEN_DOCUMENTS = 4
+# Held by a worker while it uses a cached document and while the reaper closes them
+_documents_lock = threading.Lock()
+# Seconds between checks for cached documents whose file was removed
+_REAP_INTERVAL = 2
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn keeps the workers free of the parent's sockets and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=OCR_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_start_reaper,
+        )
+    return _pool
+
+
+def _discard_broken_pool(pool: ProcessPoolExecutor):
+    """
+    A pool stays unusable once one of its workers dies (a tesseract crash,
+    an OOM kill), so drop it: the job that hit it fails, the next one gets a
+    fresh pool.
+    """
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_ocr_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _reap_documents():
+    """
+    Close cached documents whose spool file was removed once its job ended.
+    An open document keeps the deleted file's disk space allocated, also in
+    a worker that gets no further pages.
+    """
+    while True:
+        time.sleep(_REAP_INTERVAL)
+        with _documents_lock:
+            for path in [path for path in _open_documents if not os.path.exists(path)]:
+                _open_documents.pop(path).close()
+
+
+def _start_reaper():
+    threading.Thread(target=_reap_documents, name="ocr-document-reaper", daemon=True).start()
+
+
+def _worker_document(path: str) -> pymupdf.Document:
+    doc = _open_documents.get(path)
+    if doc is not None:
+        _open_documents.move_to_end(path)
+        return doc
+
+    doc = pymupdf.open(path)
+    _open_documents[path] = doc
+    while len(_open_documents) > _MAX_OPEN_DOCUMENTS:
+        _, stale = _open_documents.popitem(last=False)
+        stale.close()
+    return doc
+
+
+def text_quality(text: str) -> float:
+    """Fraction of whitespace separated tokens that look like real words (0..1)."""
+    tokens = text.split()
+    if not tokens:
+        return 0.0
+    good = sum(1 for token in tokens if _WORD_RE.match(token) and any(c.isalnum() for c in token))
+    return good / len(tokens)
+
+
+def image_coverage(page: pymupdf.Page) -> float:
+    """Share of the page area covered by images, capped at 1."""
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(pymupdf.Rect(info["bbox"]) & page.rect)
+    return min(covered / page_area, 1.0)
+
+
+def text_layer_usable(text: str, coverage: float) -> bool:
+    stripped = text.strip()
+    if len(stripped) < TEXT_LAYER_MIN_CHARS:
+        return False
+    if text_quality(stripped) < TEXT_LAYER_MIN_QUALITY:
+        return False
+    # A scan with a small caption or stamp as its only text
+    if coverage > TEXT_LAYER_MAX_IMAGE_COVERAGE and len(stripped) < TEXT_LAYER_MIN_CHARS * 4:
+        return False
+    return True
+
+
+def ocr_with_confidence(image) -> Tuple[str, float]:
+    """
+    OCR an image (PIL image or file path) and return its text with the mean
+    word confidence (0..1).
+
+    The text is rebuilt from tesseract's word boxes so only one OCR pass is
+    needed: words joined by spaces, lines by newlines and paragraphs by a
+    blank line, like image_to_string.
+    """
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    paragraphs = []
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        paragraph_key = (data["block_num"][i], data["par_num"][i])
+        if not paragraphs or paragraphs[-1] != paragraph_key:
+            paragraphs.append(paragraph_key)
+        lines.setdefault(paragraph_key, {}).setdefault(data["line_num"][i], []).append(word)
+        confidence = float(data["conf"][i])
+        if confidence >= 0:
+            confidences.append(confidence)
+
+    text = "\n\n".join(
+        "\n".join(" ".join(words) for words in lines[key].values()) for key in paragraphs
+    )
+    confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+    return text, confidence
+
+
+def _ocr_page(page: pymupdf.Page, page_index: int) -> dict:
+    # Write the render straight to a PNG for tesseract and drop the pixmap,
+    # so at most one page image per worker is in memory and no PIL copy is made
+    with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+        start = time.perf_counter()
+        pix = page.get_pixmap()
+        pix.save(image_file.name)
+        del pix
+        rendered = time.perf_counter()
+        text, confidence = ocr_with_confidence(image_file.name)
+        timings = {"render": rendered - start, "ocr": time.perf_counter() - rendered}
+    # Release images MuPDF decoded and cached while rendering this page
+    pymupdf.TOOLS.store_shrink(100)
+    return {"page": page_index + 1, "original_text": text, "extraction": "ocr", "confidence": confidence,
+            "timings": timings}
+
+
+def ocr_pdf_page(path: str, page_index: int) -> dict:
+    """Render and OCR a single PDF page. Runs inside a pool worker."""
+    with _documents_lock:
+        return _ocr_page(_worker_document(path)[page_index], page_index)
+
+
+def extract_pdf_page(path: str, page_index: int) -> dict:
+    """
+    Get the text of a single PDF page, from its text layer when usable and
+    through OCR otherwise. Runs inside a pool worker.
+    """
+    start = time.perf_counter()
+    with _documents_lock:
+        page = _worker_document(path)[page_index]
+        text = page.get_text()
+        if text_layer_usable(text, image_coverage(page)):
+            return {"page": page_index + 1, "original_text": text, "extraction": "text",
+                    "confidence": text_quality(text), "timings": {"text_layer": time.perf_counter() - start}}
+        return _ocr_page(page, page_index)
+
+
+def ocr_image(path: str) -> dict:
+    # tesseract reads the spooled file itself, the image is never decoded here
+    start = time.perf_counter()
+    text, confidence = ocr_with_confidence(path)
+    return {"page": 1, "original_text": text, "extraction": "ocr", "confidence": confidence,
+            "timings": {"ocr": time.perf_counter() - start}}
+
+
+def pdf_page_count(path: str) -> int:
+    with pymupdf.open(path) as doc:
+        return doc.page_count
+
+
+async def iter_pdf_pages(path: str, page_count: int, max_in_flight: int = OCR_MAX_IN_FLIGHT,
+                         use_text_layer: bool = PDF_TEXT_LAYER) -> AsyncIterator[dict]:
+    """
+    Extract the pages of a PDF on the process pool, yielding results in page order.
+
+    Each result records whether the page came from the text layer or OCR in
+    its `extraction` key, how reliable its text is as a 0..1 `confidence`,
+    and the seconds spent per stage in the worker as `timings`. At most
+    `max_in_flight` pages are queued or being processed at any time.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_ocr_pool()
+    extract = extract_pdf_page if use_text_layer else ocr_pdf_page
+    pending = deque()
+    next_index = 0
+
+    try:
+        while next_index < page_count or pending:
+            while next_index < page_count and len(pending) < max_in_flight:
+                pending.append(loop.run_in_executor(pool, extract, path, next_index))
+                next_index += 1
+            yield await pending.popleft()
+    except BrokenProcessPool:
+        _discard_broken_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def ocr_image_file(path: str) -> dict:
+    loop = asyncio.get_running_loop()
+    pool = get_ocr_pool()
+    try:
+        return await loop.run_in_executor(pool, ocr_image, path)
+    except BrokenProcessPool:
+        _discard_broken_pool(pool)
+        raise
@@ -1 +1 @@
-from .types import User, Token, TokenData, User, UserInDB, DocumentModel, QueryRequest, DocumentIDsRequest, UserRegister
+from .types import User, Token, TokenData, User, UserInDB, DocumentModel, Chunk, QueryRequest, DocumentIDsRequest, UserRegister, JobStatus
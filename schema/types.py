@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -34,6 +34,9 @@ class Paragraph(BaseModel):
 class Page(BaseModel):
     original_text: str
     page: int
+    extraction: str = "ocr"  # "text" when taken from the PDF text layer, "ocr" otherwise
+    confidence: Optional[float] = None  # 0..1 OCR word confidence or text layer quality
+    refined: bool = True  # False when the LLM cleanup pass was skipped
     paragraphs: List[Paragraph]
     refined_text: str
 
@@ -43,12 +46,46 @@ class DocumentModel(BaseModel):
     filename: str
     pages: List[Page]
     username: str
+    pages_refined: Optional[int] = None
+    pages_skipped: Optional[int] = None
+    content_hash: Optional[str] = None  # SHA-256 of the uploaded file
+
+
+class Chunk(BaseModel):
+    text: str
+    token_count: int
+    overlap_tokens: int = 0  # Leading tokens repeated from the previous chunk
+    page: int  # Page and paragraph where the chunk's own text starts
+    paragraph: int
+    page_end: int  # Page and paragraph where it ends
+    paragraph_end: int
 
 
 class QueryRequest(BaseModel):
     query: str
     document_ids: Optional[List[str]] = None
+    mode: Optional[Literal["dense", "sparse", "hybrid"]] = None
 
 
 class DocumentIDsRequest(BaseModel):
     document_ids: List[str]
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    username: str
+    filename: str
+    status: str = "queued"  # queued | processing | done | failed
+    stage: Optional[str] = None
+    total_pages: Optional[int] = None
+    pages_done: int = 0
+    pages_refined: Optional[int] = None
+    pages_skipped: Optional[int] = None
+    document_id: Optional[str] = None
+    chunks_total: Optional[int] = None
+    chunks_indexed: int = 0
+    chunks_failed: int = 0
+    chunks_per_second: Optional[float] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float